@@ -1,75 +1,431 @@
 # Icon_Converter_Algorithm.py
 
+import hashlib
+import io
 import logging
 import os
 import math
-from PIL import Image
-from typing import Tuple, Optional
+from PIL import Image, ImageChops, ImageDraw, ImageMath
+from typing import BinaryIO, Callable, Dict, Iterable, List, Sequence, Tuple, Optional, Union
 import colorsys
+import threading
+import weakref
+from functools import partial
+
+from Icon_Converter_Cache import ConversionCache, cache_key, file_digest
+from Icon_Converter_Encoder import IconEncoder, fit_size
+from Icon_Converter_Metrics import ConversionMetrics, StageCallback
+from Icon_Converter_Streaming import StreamingSource
+
+_NOT_IMPORTED = object()
+# NumPy is optional; the engines fall back to pure Pillow without it. _numpy() imports it on first use,
+# since it is most of this module's import time and the GUI imports the module before its first frame.
+# Setting np = None forces the Pillow paths.
+np = _NOT_IMPORTED
+
+# Bump whenever a change alters detected colors, bboxes or icon bytes, so cached results are not reused.
+CONVERTER_VERSION = 3
+
+# Inputs picked up by folder scans and offered by the GUI; TIFF, BMP and PPM can be read in strips.
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.tif', '.tiff', '.bmp', '.ppm', '.pgm')
+
+ProgressCallback = Callable[[int, int], None]
+# One lock per Image source serializes its load(): a lazily opened image may be shared by converters on
+# several threads, while unrelated images load in parallel. Keyed by id(), since Images are not hashable;
+# the entry goes away with the image.
+_SOURCE_LOAD_LOCKS: Dict[int, threading.Lock] = {}
+_SOURCE_LOAD_LOCKS_GUARD = threading.Lock()
+# A file path, the encoded file's bytes, a binary file object or an already opened image.
+ImageSource = Union[str, os.PathLike, bytes, bytearray, memoryview, BinaryIO, Image.Image]
+
+
+class ConversionCancelled(Exception):
+    """Raised when a conversion is stopped through its cancel_event."""
+
+
+def _numpy():
+    """The numpy module, or None when it is not installed or disabled."""
+    global np
+    if np is _NOT_IMPORTED:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        np = numpy
+    return np
+
+
+def _source_load_lock(img: Image.Image) -> threading.Lock:
+    with _SOURCE_LOAD_LOCKS_GUARD:
+        lock = _SOURCE_LOAD_LOCKS.get(id(img))
+        if lock is None:
+            lock = _SOURCE_LOAD_LOCKS[id(img)] = threading.Lock()
+            weakref.finalize(img, _SOURCE_LOAD_LOCKS.pop, id(img), None)
+        return lock
+
+
+def _check_cancelled(cancel_event: Optional[threading.Event]):
+    if cancel_event is not None and cancel_event.is_set():
+        raise ConversionCancelled()
+
+
+def _squared_distance(c1: Sequence[int], c2: Sequence[int]) -> int:
+    return sum((a - b) * (a - b) for a, b in zip(c1, c2))
+
+
+def _image_math(expression: str, **operands) -> Image.Image:
+    """
+    Evaluates an ImageMath expression. Pillow 10.3 renamed eval() to unsafe_eval(); the expressions
+    passed here are all built in this module, never from user input.
+    """
+    evaluate = getattr(ImageMath, 'unsafe_eval', None) or ImageMath.eval
+    return evaluate(expression, **operands)
+
+
+def _squared_distance_map(img: Image.Image, reference: Tuple[int, ...]) -> Image.Image:
+    """'I' image of squared distances to reference, over RGB or, for 4-value references, RGBA."""
+    mode = 'RGBA' if len(reference) == 4 else 'RGB'
+    source = img if img.mode == mode else img.convert(mode)
+    diff = ImageChops.difference(source, Image.new(mode, source.size, tuple(reference)))
+    channels = {f"c{index}": band for index, band in enumerate(diff.split())}
+    return _image_math(" + ".join(f"{name} * {name}" for name in channels), **channels)
+
+
+def _within_distance(img: Image.Image, reference: Tuple[int, ...], limit: int) -> Image.Image:
+    """
+    'L' mask, nonzero where the squared distance to reference is <= limit. Compares RGB for
+    3-value references and RGBA for 4-value ones.
+    """
+    return _image_math("convert(d <= limit, 'L')", d=_squared_distance_map(img, reference), limit=limit)
 
 
 class IconConverter:
     TARGET_SIZES = [
         (16, 16), (24, 24), (32, 32), (48, 48), (64, 64), (128, 128), (256, 256)
     ]
+    DOMINANT_COLOR_METHODS = ('histogram', 'mediancut', 'kmeans')
+    HISTOGRAM_BITS = 5
+    CLUSTER_COUNT = 16
+    KMEANS_ITERATIONS = 4
+    MASK_BAND_ROWS = 256
+    # Above this many pixels the source is processed in strips instead of as one RGBA buffer.
+    STREAMING_MIN_PIXELS = 64_000_000
+    # How convert() decides which pixels are the subject; see resolve_mode() for 'auto'.
+    SUBJECT_MODES = ('color', 'auto', 'alpha', 'background', 'palette')
+    ALPHA_THRESHOLD = 0  # 'alpha': pixels with a higher alpha are subject
+    PALETTE_SIZE = 6  # 'palette': colors detected when no palette is given
+    CORNER_TOLERANCE = 24  # 'auto': corners this close count as one background color
+    PLACEHOLDER_COLOR = (0, 0, 0)  # subject_color for modes that do not match against it
 
-    def __init__(self, input_path: str):
-        if not os.path.isfile(input_path):
-            raise FileNotFoundError(f"Input file not found: {input_path}")
-        self.input_path = input_path
-        self.image: Optional[Image.Image] = None
+    def __init__(self, source: ImageSource, encoder: Optional[IconEncoder] = None,
+                 cache: Optional[ConversionCache] = None, streaming: Optional[bool] = None,
+                 stage_callback: Optional[StageCallback] = None):
+        """
+        source is a file path, or for services that never touch the disk, the encoded image as
+        bytes or a binary file object (read once, here), or a PIL Image. An Image is used as is, not
+        copied; a lazily opened one is loaded under a lock, so one Image may be shared by threads.
+        Only file paths can be streamed.
 
-    def _color_distance(self, c1: Tuple[int, ...], c2: Tuple[int, ...]) -> float:
-        r1, g1, b1, *_ = c1
-        r2, g2, b2, *_ = c2
-        return math.sqrt((r1 - r2) ** 2 + (g1 - g2) ** 2 + (b1 - b2) ** 2)
+        A converter keeps the results of its last call (bbox, subject_mode, metrics), so use one
+        per thread; convert_to_ico() does that for you.
+        """
+        self.input_path: Optional[str] = None
+        self._source_bytes: Optional[bytes] = None
+        self._source_image: Optional[Image.Image] = None
+        if isinstance(source, Image.Image):
+            self._source_image = source
+        elif isinstance(source, (bytes, bytearray, memoryview)):
+            self._source_bytes = bytes(source)
+        elif hasattr(source, 'read'):
+            self._source_bytes = source.read()
+        else:
+            if not os.path.isfile(source):
+                raise FileNotFoundError(f"Input file not found: {source}")
+            self.input_path = os.fspath(source)
+        self.encoder = encoder or IconEncoder()
+        self.cache = cache
+        self._input_digest: Optional[str] = None
+        self.bbox: Optional[Tuple[int, int, int, int]] = None
+        self.subject_mode: Optional[str] = None  # Mode the last convert() actually used
+        self._rgba: Optional[Image.Image] = None
+        # None picks streaming for sources larger than STREAMING_MIN_PIXELS when it saves memory (see
+        # StreamingSource.saves_memory).
+        self.streaming = streaming
+        self._stream: Optional[StreamingSource] = None
+        # Stage timings of the last find_dominant_color() or convert() call.
+        self.stage_callback = stage_callback
+        self.metrics = self._new_metrics()
 
-    def find_dominant_color(self) -> Optional[Tuple[int, int, int]]:
-        logging.info("🔍 Analyzing image for dominant color...")
-        img = Image.open(self.input_path).convert('RGBA')
+    def __enter__(self) -> 'IconConverter':
+        return self
 
-        corners = [
-            img.getpixel((0, 0)), img.getpixel((img.width - 1, 0)),
-            img.getpixel((0, img.height - 1)), img.getpixel((img.width - 1, img.height - 1))
-        ]
-        bg_color = max(set(corners), key=corners.count)
-        logging.info(f"Detected background color: {bg_color[:3]}")
+    def __exit__(self, *exc_info):
+        self.release()
 
-        img.thumbnail((256, 256))
+    @property
+    def rgba(self) -> Image.Image:
+        """
+        The decoded source as RGBA, decoded on first use and shared by detection, cropping and saving.
 
-        color_counts = {}
-        for x in range(img.width):
-            for y in range(img.height):
-                r, g, b, a = img.getpixel((x, y))
-                if a < 128 or self._color_distance((r, g, b), bg_color[:3]) < 50:
-                    continue
-                rgb_tuple = (r, g, b)
-                color_counts[rgb_tuple] = color_counts.get(rgb_tuple, 0) + 1
+        Holding it costs width * height * 4 bytes (64 MiB for a 4096x4096 source) until release().
+        """
+        if self._rgba is None:
+            with self.metrics.stage('decode'):
+                if self._source_image is not None:
+                    img = self._loaded_source_image()
+                else:
+                    img = Image.open(io.BytesIO(self._source_bytes) if self._source_bytes is not None
+                                     else self.input_path)
+                    img.load()
+            logging.info(f"Source image loaded: {img.size}, Mode: {img.mode}")
+            with self.metrics.stage('rgba'):
+                self._rgba = img if img.mode == 'RGBA' else img.convert('RGBA')
+        return self._rgba
 
-        if not color_counts:
-            logging.error("Could not find any dominant color candidates.")
-            return None
+    @property
+    def input_digest(self) -> str:
+        """SHA-256 of the input file contents (or of the pixels of an Image source), the base of every cache key."""
+        if self._input_digest is None:
+            with self.metrics.stage('hash'):
+                if self._source_image is not None:
+                    img = self._loaded_source_image()
+                    digest = hashlib.sha256(f"{img.mode} {img.size}".encode('ascii'))
+                    # Row bands, so hashing never copies the whole pixel buffer at once.
+                    for top in range(0, img.height, self.MASK_BAND_ROWS):
+                        bottom = min(top + self.MASK_BAND_ROWS, img.height)
+                        digest.update(img.crop((0, top, img.width, bottom)).tobytes())
+                    self._input_digest = digest.hexdigest()
+                elif self._source_bytes is not None:
+                    self._input_digest = hashlib.sha256(self._source_bytes).hexdigest()
+                else:
+                    self._input_digest = file_digest(self.input_path)
+        return self._input_digest
+
+    def _loaded_source_image(self) -> Image.Image:
+        """The Image source, loaded. Loading is not thread-safe, and the caller may share the image."""
+        with _source_load_lock(self._source_image):
+            self._source_image.load()
+        return self._source_image
+
+    @property
+    def stream(self) -> StreamingSource:
+        """Strip-wise reader for the source, used instead of rgba for very large inputs."""
+        if self._stream is None:
+            self._stream = StreamingSource(self.input_path, self.MASK_BAND_ROWS)
+        return self._stream
+
+    def _new_metrics(self) -> ConversionMetrics:
+        return ConversionMetrics([self.stage_callback] if self.stage_callback else [])
+
+    def _use_streaming(self) -> bool:
+        if self._rgba is not None:
+            return False  # Already decoded; reuse it.
+        if self.input_path is None:
+            return False  # In-memory sources are already held in full.
+        if self.streaming is not None:
+            return self.streaming
+        width, height = self.stream.size
+        return width * height >= self.STREAMING_MIN_PIXELS and self.stream.saves_memory
+
+    def release(self):
+        """Drops the decoded source. It is decoded again if needed."""
+        self._rgba = None
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+
+    @staticmethod
+    def _thumbnail(img: Image.Image, size: Tuple[int, int]) -> Image.Image:
+        """Same result as Image.thumbnail(), but returns a new image instead of shrinking img in place."""
+        thumb_size = fit_size(img.size, size)
+        if thumb_size == img.size:
+            return img
+        return img.resize(thumb_size, Image.Resampling.BICUBIC, reducing_gap=2.0)
+
+    def _candidate_colors(self, img: Image.Image, bg_color: Tuple[int, ...]):
+        """Exact (counts, colors) of opaque pixels that are not close to the background color."""
+        if _numpy() is not None:
+            pixels = np.asarray(img).reshape(-1, 4).astype(np.int32)
+            delta = pixels[:, :3] - np.asarray(bg_color[:3], dtype=np.int32)
+            keep = (pixels[:, 3] >= 128) & ((delta * delta).sum(axis=1) >= 50 * 50)
+            rgb = pixels[keep, :3]
+            packed = (rgb[:, 0] << 16) | (rgb[:, 1] << 8) | rgb[:, 2]
+            packed, counts = np.unique(packed, return_counts=True)
+            colors = np.stack([packed >> 16, (packed >> 8) & 0xFF, packed & 0xFF], axis=1)
+            return counts, colors
+
+        # Pure-Pillow path: fold the keep-mask into the alpha channel and let getcolors() count.
+        r, g, b, a = img.split()
+        far = _image_math("convert(d >= 2500, 'L')", d=_squared_distance_map(img, tuple(bg_color[:3])))
+        keep = ImageChops.multiply(a.point(lambda v: 255 if v >= 128 else 0), far.point(lambda v: 255 if v else 0))
+        masked = Image.merge('RGBA', (r, g, b, keep))
+        counted = masked.getcolors(maxcolors=img.width * img.height) or []
+        kept = [(count, color[:3]) for count, color in counted if color[3]]
+        return [count for count, _ in kept], [color for _, color in kept]
+
+    def _histogram_bins(self, counts, colors):
+        """Collapse exact colors into 5-bit-per-channel bins, returning (bin counts, bin mean colors)."""
+        if _numpy() is not None:
+            quantized = colors >> (8 - self.HISTOGRAM_BITS)
+            bins = (quantized[:, 0] << (2 * self.HISTOGRAM_BITS)) | (quantized[:, 1] << self.HISTOGRAM_BITS) | quantized[:, 2]
+            bin_ids, inverse = np.unique(bins, return_inverse=True)
+            bin_counts = np.bincount(inverse, weights=counts)
+            sums = np.stack([np.bincount(inverse, weights=counts * colors[:, c]) for c in range(3)], axis=1)
+            return bin_counts, np.rint(sums / bin_counts[:, None]).astype(np.int32)
+
+        shift = 8 - self.HISTOGRAM_BITS
+        totals = {}
+        for count, (r, g, b) in zip(counts, colors):
+            entry = totals.setdefault((r >> shift, g >> shift, b >> shift), [0, 0, 0, 0])
+            entry[0] += count
+            entry[1] += count * r
+            entry[2] += count * g
+            entry[3] += count * b
+        bin_counts = [n for n, *_ in totals.values()]
+        means = [tuple(int(round(total / n)) for total in sums) for n, *sums in totals.values()]
+        return bin_counts, means
+
+    def _cluster_colors(self, counts, colors, method: str):
+        """Group candidate colors with Pillow's median-cut quantizer, optionally refined by k-means."""
+        if _numpy() is not None:
+            pixels = np.repeat(colors, counts, axis=0).astype(np.uint8)
+            sample = Image.fromarray(pixels.reshape(1, -1, 3), 'RGB')
+        else:
+            pixels = [color for count, color in zip(counts, colors) for _ in range(count)]
+            sample = Image.new('RGB', (len(pixels), 1))
+            sample.putdata(pixels)
+
+        kmeans = self.KMEANS_ITERATIONS if method == 'kmeans' else 0
+        quantized = sample.quantize(colors=self.CLUSTER_COUNT, method=Image.Quantize.MEDIANCUT, kmeans=kmeans)
+        palette = quantized.getpalette()
+        clusters = quantized.getcolors(maxcolors=256) or []
+        cluster_counts = [count for count, _ in clusters]
+        cluster_colors = [tuple(palette[index * 3:index * 3 + 3]) for _, index in clusters]
+        if _numpy() is not None:
+            return np.asarray(cluster_counts), np.asarray(cluster_colors, dtype=np.int32)
+        return cluster_counts, cluster_colors
+
+    def _best_vibrant_color(self, counts, colors) -> Optional[Tuple[int, int, int]]:
+        """Pick the color maximising count * saturation**2 among moderately lit, saturated colors."""
+        if _numpy() is not None:
+            rgb = colors / 255.0
+            high, low = rgb.max(axis=1), rgb.min(axis=1)
+            lightness = (high + low) / 2.0
+            span = high - low
+            # Same saturation formula as colorsys.rgb_to_hls, evaluated for every color at once.
+            denominator = np.where(lightness <= 0.5, high + low, 2.0 - high - low)
+            saturation = np.divide(span, denominator, out=np.zeros_like(span), where=span > 0)
+            vibrant = (lightness > 0.1) & (lightness < 0.9) & (saturation > 0.15)
+            if not vibrant.any():
+                return None
+            scores = np.where(vibrant, counts * saturation ** 2, -1.0)
+            return tuple(int(c) for c in colors[int(np.argmax(scores))])
 
-        # --- LOGIC TO FIND THE BEST COLOR ---
         best_color = None
         max_score = -1
-
-        for color, count in color_counts.items():
-            # Convert RGB to HSL to get saturation. HSL values are 0-1.
+        for color, count in zip(colors, counts):
             r, g, b = [x / 255.0 for x in color]
             _, lightness, saturation = colorsys.rgb_to_hls(r, g, b)
-
-            # Ignore colors that are too dark, too bright, or not saturated enough
             if not (0.1 < lightness < 0.9 and saturation > 0.15):
                 continue
-
-            # Score is based on count and how colorful it is (saturation)
             score = count * (saturation ** 2)
-
             if score > max_score:
                 max_score = score
-                best_color = color
+                best_color = tuple(color)
+        return best_color
+
+    def find_dominant_color(self, method: str = 'histogram',
+                            cancel_event: Optional[threading.Event] = None) -> Optional[Tuple[int, int, int]]:
+        """
+        Detects the most vibrant, frequent color of the subject.
+
+        'histogram' (default) scores 5-bit-per-channel color bins and is the fastest.
+        'mediancut' and 'kmeans' cluster the colors first, which copes better with gradients.
+        Stage timings are left in self.metrics.
+        """
+        if method not in self.DOMINANT_COLOR_METHODS:
+            raise ValueError(f"Unknown dominant color method: {method!r}")
+        self.metrics = self._new_metrics()
+
+        if self.cache is not None:
+            key = cache_key('color', CONVERTER_VERSION, self.input_digest, method)
+            with self.metrics.stage('cache'):
+                hit, cached = self.cache.get_value('color', key)
+            if hit:
+                best_color = tuple(cached) if cached else None
+                logging.info(f"✅ Dominant color found (cached): {best_color}")
+                return best_color
+            best_color = self._detect_dominant_color(method, cancel_event)
+            with self.metrics.stage('cache'):
+                self.cache.put_value('color', key, best_color)
+            return best_color
+        return self._detect_dominant_color(method, cancel_event)
+
+    @staticmethod
+    def _image_corners(img: Image.Image) -> List[Tuple[int, ...]]:
+        return [img.getpixel((0, 0)), img.getpixel((img.width - 1, 0)),
+                img.getpixel((0, img.height - 1)), img.getpixel((img.width - 1, img.height - 1))]
+
+    @staticmethod
+    def _background_color(corners: Sequence[Tuple[int, ...]]) -> Tuple[int, ...]:
+        """The most common of the four corner colors."""
+        return max(set(corners), key=corners.count)
+
+    def _detection_sample(self, cancel_event: Optional[threading.Event] = None) -> Tuple[Image.Image, Tuple[int, ...]]:
+        """A thumbnail of at most 256x256 and the background color, shared by color and palette detection."""
+        if self._use_streaming():
+            # Corners and a reduced copy are all detection needs; avoid a full-size RGBA decode.
+            with self.metrics.stage('decode'):
+                corners = self.stream.corners()
+                img = self.stream.reduced((256, 256))
+        else:
+            img = self.rgba
+            corners = self._image_corners(img)
+        _check_cancelled(cancel_event)
+
+        with self.metrics.stage('thumbnail'):
+            img = self._thumbnail(img, (256, 256))
+        return img, self._background_color(corners)
+
+    def find_subject_palette(self, count: Optional[int] = None) -> List[Tuple[int, int, int]]:
+        """
+        The count (default PALETTE_SIZE) most frequent colors of the subject, most frequent first.
+
+        Colors far from the background are clustered with median cut, like the 'mediancut'
+        dominant color method. Used by the 'palette' subject mode when no palette is given.
+        """
+        img, bg_color = self._detection_sample()
+        counts, colors = self._candidate_colors(img, bg_color)
+        if len(counts) == 0:
+            return []
+        counts, colors = self._cluster_colors(counts, colors, 'mediancut')
+        order = sorted(range(len(counts)), key=lambda index: -counts[index])
+        palette = [tuple(int(v) for v in colors[index]) for index in order[:count or self.PALETTE_SIZE]]
+        logging.info(f"Subject palette: {palette}")
+        return palette
+
+    def _detect_dominant_color(self, method: str,
+                               cancel_event: Optional[threading.Event]) -> Optional[Tuple[int, int, int]]:
+        logging.info("🔍 Analyzing image for dominant color...")
+        img, bg_color = self._detection_sample(cancel_event)
+        logging.info(f"Detected background color: {bg_color[:3]}")
+
+        _check_cancelled(cancel_event)
+        with self.metrics.stage('candidates'):
+            counts, colors = self._candidate_colors(img, bg_color)
+        if len(counts) == 0:
+            logging.error("Could not find any dominant color candidates.")
+            return None
+
+        with self.metrics.stage('cluster'):
+            if method == 'histogram':
+                counts, colors = self._histogram_bins(counts, colors)
+            else:
+                counts, colors = self._cluster_colors(counts, colors, method)
 
+        with self.metrics.stage('select'):
+            best_color = self._best_vibrant_color(counts, colors)
+        logging.info(f"⏱️ Detection stages: {self.metrics.summary()}")
         if best_color is None:
             logging.error("Could not find any vibrant color candidates.")
             return None
@@ -77,46 +433,491 @@ class IconConverter:
         logging.info(f"✅ Dominant color found: {best_color}")
         return best_color
 
-    def _crop_to_subject(self, img: Image.Image, subject_color: Tuple[int, int, int], tolerance: int) -> Image.Image:
-        if img.mode != 'RGBA':
-            img = img.convert('RGBA')
+    @classmethod
+    def resolve_mode(cls, mode: str, corners: Sequence[Tuple[int, ...]]) -> str:
+        """
+        The subject mode that 'auto' stands for, given the four RGBA corner pixels of the source.
+
+        Cheapest first: 'alpha' when the corners are transparent, 'background' when they share
+        one color, otherwise 'color'. Other modes are returned unchanged.
+        """
+        if mode not in cls.SUBJECT_MODES:
+            raise ValueError(f"Unknown subject mode: {mode!r}")
+        if mode != 'auto':
+            return mode
+        if sum(1 for corner in corners if corner[3] == 0) >= 3:
+            return 'alpha'
+        background = cls._background_color(corners)
+        limit = cls.CORNER_TOLERANCE * cls.CORNER_TOLERANCE
+        if sum(1 for corner in corners if _squared_distance(corner, background) <= limit) >= 3:
+            return 'background'
+        return 'color'
+
+    def source_corners(self) -> List[Tuple[int, ...]]:
+        """The four RGBA corner pixels of the source, read from the outer strips when streaming."""
+        if self._use_streaming():
+            with self.metrics.stage('decode'):
+                return self.stream.corners()
+        return self._image_corners(self.rgba)
 
-        logging.info(f"Scanning for subject color similar to {subject_color} with tolerance {tolerance}.")
-        mask = Image.new('L', img.size, 0)
-        mask_pixels = mask.load()
-        source_pixels = img.load()
+    def needs_subject_color(self, mode: str) -> bool:
+        """
+        Whether convert() in this mode matches against subject_color, i.e. whether it is worth
+        detecting one. Otherwise any color, such as PLACEHOLDER_COLOR, will do.
+        """
+        return self.resolve_mode(mode, self.source_corners()) in ('color', 'palette')
 
-        for y in range(img.height):
-            for x in range(img.width):
-                if self._color_distance(source_pixels[x, y], subject_color) <= tolerance:
-                    mask_pixels[x, y] = 255
+    def _subject_matcher(self, mode: str, subject_color: Tuple[int, int, int], tolerance: int,
+                         palette: Optional[Sequence[Tuple[int, int, int]]],
+                         corners: Sequence[Tuple[int, ...]]) -> Tuple[str, Callable, str]:
+        """(concrete mode, per-band bbox function, description for the log) for a subject mode."""
+        mode = self.resolve_mode(mode, corners)
+        background = self._background_color(corners)
+        if mode == 'background' and background[3] == 0:
+            mode = 'alpha'  # Differing from a transparent background just means not being transparent.
+        if mode == 'alpha':
+            return mode, self._band_bbox_alpha, f"pixels with alpha above {self.ALPHA_THRESHOLD}"
 
-        bbox = mask.getbbox()
+        band_bbox = self._band_bbox_numpy if _numpy() is not None else self._band_bbox_pillow
+        limit = tolerance * tolerance
+        if mode == 'background':
+            return (mode, partial(band_bbox, references=[background], limit=limit, inside=False),
+                    f"pixels differing from the background {background} by more than {tolerance}")
 
+        references = [tuple(subject_color[:3])]
+        if mode == 'palette':
+            for color in self.find_subject_palette() if palette is None else palette:
+                if tuple(color[:3]) not in references:
+                    references.append(tuple(color[:3]))
+        return (mode, partial(band_bbox, references=references, limit=limit, inside=True),
+                f"pixels within {tolerance} of {', '.join(map(str, references))}")
+
+    def _band_bbox_alpha(self, band: Image.Image) -> Optional[Tuple[int, int, int, int]]:
+        alpha = band.getchannel('A')
+        if self.ALPHA_THRESHOLD:
+            alpha = alpha.point(lambda a: 255 if a > self.ALPHA_THRESHOLD else 0)
+        return alpha.getbbox()
+
+    def _band_bbox_numpy(self, band: Image.Image, references: Sequence[Tuple[int, ...]], limit: int,
+                         inside: bool = True) -> Optional[Tuple[int, int, int, int]]:
+        """
+        Bounding box of the band's pixels within sqrt(limit) of any reference color, or with
+        inside=False, of the pixels farther than that from all of them. RGB references compare
+        RGB, RGBA references also compare alpha.
+        """
+        pixels = np.asarray(band)
+        mask = None
+        for reference in references:
+            distance = np.zeros(pixels.shape[:2], dtype=np.int32)
+            for channel, value in enumerate(reference):
+                delta = pixels[..., channel].astype(np.int32)
+                delta -= value
+                np.multiply(delta, delta, out=delta)
+                distance += delta
+            near = distance <= limit
+            mask = near if mask is None else np.logical_or(mask, near, out=mask)
+        if not inside:
+            mask = ~mask
+
+        rows = np.flatnonzero(mask.any(axis=1))
+        if rows.size == 0:
+            return None
+        cols = np.flatnonzero(mask.any(axis=0))
+        return int(cols[0]), int(rows[0]), int(cols[-1]) + 1, int(rows[-1]) + 1
+
+    def _band_bbox_pillow(self, band: Image.Image, references: Sequence[Tuple[int, ...]], limit: int,
+                          inside: bool = True) -> Optional[Tuple[int, int, int, int]]:
+        mask = None
+        for reference in references:
+            near = _within_distance(band, reference, limit)
+            mask = near if mask is None else ImageChops.lighter(mask, near)
+        if not inside:
+            mask = mask.point(lambda v: 0 if v else 255)
+        return mask.getbbox()
+
+    def _subject_bbox(self, img: Image.Image, band_bbox: Callable[[Image.Image], Optional[Tuple[int, int, int, int]]],
+                      progress_callback: Optional[ProgressCallback] = None,
+                      cancel_event: Optional[threading.Event] = None,
+                      whole: bool = False) -> Optional[Tuple[int, int, int, int]]:
+        """
+        Bounding box of all pixels band_bbox() reports as subject.
+
+        The image is scanned in bands of MASK_BAND_ROWS rows, so temporaries stay small, progress
+        can be reported as progress_callback(rows_done, total_rows) and cancel_event is honoured
+        between bands. With whole=True it is passed to band_bbox() in one piece, for checks such as
+        the alpha bbox that need no temporaries.
+        """
+        if whole:
+            bands = [(0, img)]
+        else:
+            bands = ((top, img.crop((0, top, img.width, min(top + self.MASK_BAND_ROWS, img.height))))
+                     for top in range(0, img.height, self.MASK_BAND_ROWS))
+        return self._scan_bands(bands, img.height, band_bbox, progress_callback, cancel_event)
+
+    def _scan_bands(self, bands: Iterable[Tuple[int, Image.Image]], height: int,
+                    band_bbox: Callable[[Image.Image], Optional[Tuple[int, int, int, int]]],
+                    progress_callback: Optional[ProgressCallback] = None,
+                    cancel_event: Optional[threading.Event] = None) -> Optional[Tuple[int, int, int, int]]:
+        """Merges the per-band subject extents of consecutive (top, band) strips into one bbox."""
+        left = top = right = bottom = None
+
+        bands = iter(bands)
+        while True:
+            # For streamed sources, fetching a strip is where the file is read and decoded.
+            with self.metrics.stage('bands'):
+                item = next(bands, None)
+            if item is None:
+                break
+            band_top, band = item
+            _check_cancelled(cancel_event)
+            with self.metrics.stage('mask'):
+                box = band_bbox(band)
+            self.metrics.count('bands')
+            if box is not None:
+                if top is None:
+                    top = band_top + box[1]
+                    left, right = box[0], box[2]
+                else:
+                    left, right = min(left, box[0]), max(right, box[2])
+                bottom = band_top + box[3]
+            if progress_callback is not None:
+                progress_callback(band_top + band.height, height)
+
+        if top is None:
+            return None
+        return left, top, right, bottom
+
+    def _log_bbox(self, bbox: Optional[Tuple[int, int, int, int]]):
         if bbox:
             logging.info(f"Subject found. Cropping to bounding box: {bbox}")
-            return img.crop(bbox)
         else:
-            logging.warning("⚠️ Could not find any pixels matching the subject color. No crop applied.")
-            return img
+            logging.warning("⚠️ Could not find any subject pixels. No crop applied.")
+
+    def _crop_to_subject(self, img: Image.Image, subject_color: Tuple[int, int, int], tolerance: int,
+                         progress_callback: Optional[ProgressCallback] = None,
+                         cancel_event: Optional[threading.Event] = None, mode: str = 'color',
+                         palette: Optional[Sequence[Tuple[int, int, int]]] = None) -> Image.Image:
+        if img.mode != 'RGBA':
+            img = img.convert('RGBA')
+
+        self.subject_mode, band_bbox, description = self._subject_matcher(
+            mode, subject_color, tolerance, palette, self._image_corners(img))
+        logging.info(f"Scanning in {self.subject_mode} mode for {description}.")
+        bbox = self._subject_bbox(img, band_bbox, progress_callback, cancel_event, whole=self.subject_mode == 'alpha')
+        self.bbox = bbox
+        self._log_bbox(bbox)
+        with self.metrics.stage('crop'):
+            return img.crop(bbox) if bbox else img
+
+    def _crop_streaming(self, subject_color: Tuple[int, int, int], tolerance: int, sizes: Sequence[Tuple[int, int]],
+                        mode: str = 'color', palette: Optional[Sequence[Tuple[int, int, int]]] = None,
+                        bbox_hit: bool = False, cached_bbox: Optional[Tuple[int, int, int, int]] = None,
+                        progress_callback: Optional[ProgressCallback] = None,
+                        cancel_event: Optional[threading.Event] = None) -> Image.Image:
+        """
+        _crop_to_subject() for inputs too large to hold as RGBA.
+
+        The bbox is found strip by strip, keeping only the running extents. Then only the crop
+        region is materialized, already shrunk to about twice the largest icon size.
+        """
+        source = self.stream
+        if bbox_hit:
+            bbox = cached_bbox
+        else:
+            self.subject_mode, band_bbox, description = self._subject_matcher(
+                mode, subject_color, tolerance, palette, source.corners())
+            logging.info(f"Scanning {source.size} image in strips, in {self.subject_mode} mode, for {description}.")
+            bbox = self._scan_bands(source.bands(), source.height, band_bbox, progress_callback, cancel_event)
+        self.bbox = bbox
+        self._log_bbox(bbox)
+
+        _check_cancelled(cancel_event)
+        largest = max(max(size) for size in sizes)
+        with self.metrics.stage('crop'):
+            return source.region(bbox or (0, 0) + source.size, (2 * largest, 2 * largest))
+
+    def _restore_crop(self, crop: dict) -> Optional[Tuple[int, int, int, int]]:
+        """Applies a cached 'bbox' entry: the bbox and the subject mode that found it."""
+        self.bbox = tuple(crop['bbox']) if crop and crop['bbox'] else None
+        self.subject_mode = crop['subject_mode'] if crop else None
+        return self.bbox
 
-    def convert(self, output_path: Optional[str], subject_color: Tuple[int, int, int], tolerance: int):
+    def convert(self, output_path: Union[str, os.PathLike, BinaryIO, None], subject_color: Tuple[int, int, int],
+                tolerance: int, progress_callback: Optional[ProgressCallback] = None,
+                cancel_event: Optional[threading.Event] = None,
+                sizes: Optional[Sequence[Tuple[int, int]]] = None, mode: str = 'color',
+                palette: Optional[Sequence[Tuple[int, int, int]]] = None) -> Union[str, BinaryIO]:
+        """
+        Crops the source to the subject and writes a multi-size .ico with the given sizes
+        (TARGET_SIZES by default).
+
+        output_path is a file path (None: next to a file source) or a writable binary stream, which
+        receives the whole icon in one write(). Returns the path or the stream.
+
+        mode selects what counts as subject:
+        - 'color': pixels within tolerance of subject_color.
+        - 'alpha': non-transparent pixels, found with one getbbox() call.
+        - 'background': pixels differing from the corner background color by more than tolerance.
+        - 'palette': pixels within tolerance of subject_color or any palette color. Without an
+          explicit palette, it is detected with find_subject_palette().
+        - 'auto': the cheapest of alpha, background and color that suits the image.
+        self.subject_mode records the mode actually used.
+
+        progress_callback(rows_done, total_rows) is called from the cropping stage. Setting
+        cancel_event stops the conversion with ConversionCancelled before anything is written.
+        Stage timings are left in self.metrics and passed to the stage_callback as they finish.
+        """
+        self.metrics = self._new_metrics()
         try:
-            self.image = Image.open(self.input_path)
-            logging.info(f"Source image loaded: {self.image.size}, Mode: {self.image.mode}")
-            original_size = self.image.size
+            _check_cancelled(cancel_event)
+            sizes = self.encoder.validate_sizes(sizes or self.TARGET_SIZES)
+            output_stream = output_path if hasattr(output_path, 'write') else None
+            final_output_path = None
+            if output_stream is None:
+                if output_path is None and self.input_path is None:
+                    raise ValueError("output_path is required for in-memory sources")
+                final_output_path = output_path or f"{os.path.splitext(self.input_path)[0]}.ico"
+            subject_color = tuple(subject_color[:3])
+            if mode not in self.SUBJECT_MODES:
+                raise ValueError(f"Unknown subject mode: {mode!r}")
+            palette = [tuple(color[:3]) for color in palette] if palette is not None else None
+
+            icon_key = bbox_key = None
+            if self.cache is not None:
+                bbox_key = cache_key('bbox', CONVERTER_VERSION, self.input_digest, subject_color, tolerance,
+                                     mode, palette)
+                icon_key = cache_key('icon', CONVERTER_VERSION, self.input_digest, subject_color, tolerance,
+                                     mode, palette, sizes, self.encoder.settings())
+                with self.metrics.stage('cache'):
+                    if output_stream is None:
+                        restored = self.cache.fetch_icon(icon_key, final_output_path)
+                    else:
+                        data = self.cache.get_icon(icon_key)
+                        restored = data is not None
+                        if restored:
+                            output_stream.write(data)
+                    if restored:
+                        _, crop = self.cache.get_value('bbox', bbox_key)
+                if restored:
+                    self._restore_crop(crop)
+                    logging.info(f"✅ Icon restored from cache at: {final_output_path or 'output stream'}")
+                    return output_stream or final_output_path
 
-            self.image = self._crop_to_subject(self.image, subject_color, tolerance)
+            hit, bbox = False, None
+            if bbox_key:
+                with self.metrics.stage('cache'):
+                    hit, crop = self.cache.get_value('bbox', bbox_key)
+                if hit:
+                    bbox = self._restore_crop(crop)
+                    logging.info(f"Using cached bounding box: {bbox} ({self.subject_mode} mode)")
 
-            if self.image.size != original_size:
-                logging.info(f"✅ Successfully cropped image from {original_size} to {self.image.size}.")
+            if self._use_streaming():
+                original_size = self.stream.size
+                cropped = self._crop_streaming(subject_color, tolerance, sizes, mode, palette, hit, bbox,
+                                               progress_callback, cancel_event)
             else:
-                logging.warning("⚠️ Image was not cropped. Check your subject color and try a higher tolerance.")
+                source = self.rgba
+                original_size = source.size
+                if hit:
+                    self.bbox = bbox
+                    with self.metrics.stage('crop'):
+                        cropped = source.crop(bbox) if bbox else source
+                else:
+                    cropped = self._crop_to_subject(source, subject_color, tolerance,
+                                                    progress_callback, cancel_event, mode, palette)
+            if bbox_key and not hit:
+                with self.metrics.stage('cache'):
+                    self.cache.put_value('bbox', bbox_key, {'bbox': self.bbox, 'subject_mode': self.subject_mode})
 
-            final_output_path = output_path or f"{os.path.splitext(self.input_path)[0]}.ico"
-            self.image.save(final_output_path, format='ICO', sizes=self.TARGET_SIZES)
-            logging.info(f"✅ Icon created successfully at: {final_output_path}")
+            self.metrics.count('source_pixels', original_size[0] * original_size[1])
+            cropped_size = (self.bbox[2] - self.bbox[0], self.bbox[3] - self.bbox[1]) if self.bbox else original_size
+            if cropped_size != original_size:
+                logging.info(f"✅ Successfully cropped image from {original_size} to {cropped_size}.")
+            else:
+                hint = ("The image has no transparent border." if self.subject_mode == 'alpha'
+                        else "Check your subject color and try a higher tolerance.")
+                logging.warning(f"⚠️ Image was not cropped. {hint}")
+
+            _check_cancelled(cancel_event)
+            data = self.encoder.encode(cropped, sizes, self.metrics)
+            del cropped
+            with self.metrics.stage('write'):
+                if output_stream is not None:
+                    output_stream.write(data)
+                else:
+                    if os.path.isfile(final_output_path) and os.stat(final_output_path).st_nlink > 1:
+                        os.remove(final_output_path)  # Don't write through a hard link into the cache.
+                    with open(final_output_path, 'wb') as f:
+                        f.write(data)
+            self.metrics.count('ico_bytes', len(data))
+            if icon_key:
+                with self.metrics.stage('cache'):
+                    self.cache.put_icon(icon_key, data)
+            logging.info(f"⏱️ Conversion stages: {self.metrics.summary()}")
+            logging.info(f"✅ Icon created successfully at: {final_output_path or 'output stream'}")
+            return output_stream or final_output_path
 
+        except ConversionCancelled:
+            logging.warning("⚠️ Conversion cancelled.")
+            raise
         except Exception as e:
             logging.error(f"❌ An unexpected error occurred: {e}")
             raise
+
+    def convert_to_bytes(self, subject_color: Tuple[int, int, int], tolerance: int, **options) -> bytes:
+        """convert() without touching the disk: returns the .ico file contents."""
+        buffer = io.BytesIO()
+        self.convert(buffer, subject_color, tolerance, **options)
+        return buffer.getvalue()
+
+
+def convert_to_ico(source: ImageSource, subject_color: Optional[Tuple[int, int, int]], tolerance: int,
+                   output: Optional[BinaryIO] = None, encoder: Optional[IconEncoder] = None,
+                   cache: Optional[ConversionCache] = None, **options) -> bytes:
+    """
+    One-shot, thread-safe conversion of an in-memory (or on-disk) source to .ico bytes.
+
+    Every call uses its own IconConverter, so calls can run concurrently from a thread pool. With
+    subject_color None, the dominant color is detected first, if the subject mode uses it. The icon is also written to output
+    when given. options are passed on to convert() (sizes, mode, palette, cancel_event, ...).
+    Frames are encoded serially unless an encoder says otherwise, since the callers are already
+    running in parallel.
+    """
+    with IconConverter(source, encoder=encoder or IconEncoder(max_workers=1), cache=cache) as converter:
+        if subject_color is None:
+            if converter.needs_subject_color(options.get('mode', 'color')):
+                subject_color = converter.find_dominant_color(cancel_event=options.get('cancel_event'))
+                if subject_color is None:
+                    raise ValueError("Auto-detection could not find a subject color")
+            else:
+                subject_color = IconConverter.PLACEHOLDER_COLOR
+        data = converter.convert_to_bytes(subject_color, tolerance, **options)
+    if output is not None:
+        output.write(data)
+    return data
+
+
+class SubjectPreview:
+    """
+    Fast, approximate crop preview on a downscaled proxy of the source.
+
+    set_subject_color() computes a per-pixel map once: the squared distance to the subject color
+    (or the nearest palette color), to the background, or the alpha value, depending on the mode.
+    bbox() and render() then only threshold that map, so they are cheap enough to run on every
+    tolerance slider tick. The real crop is still computed at full resolution by
+    IconConverter.convert().
+    """
+    PROXY_SIZE = (256, 256)
+
+    def __init__(self, source: Image.Image, proxy_size: Tuple[int, int] = PROXY_SIZE,
+                 palette: Optional[Sequence[Tuple[int, int, int]]] = None,
+                 source_size: Optional[Tuple[int, int]] = None):
+        """source_size is the full size when source is already a reduced copy, e.g. StreamingSource.reduced()."""
+        self.source_size = source_size or source.size
+        proxy = IconConverter._thumbnail(source, proxy_size)
+        self.proxy = proxy if proxy.mode == 'RGBA' else proxy.convert('RGBA')
+        # Shown for pixels outside the mask.
+        self._dimmed = Image.blend(self.proxy, Image.new('RGBA', self.proxy.size, (0, 0, 0, 255)), 0.65)
+        self._corners = IconConverter._image_corners(self.proxy)
+        self.palette = [tuple(color[:3]) for color in palette or []]  # Used by 'palette' mode
+        self.subject_color: Optional[Tuple[int, int, int]] = None
+        self.mode: Optional[str] = None  # Concrete mode, with 'auto' resolved
+        self._subject_key = None
+        self._distance = None
+        # Subject pixels are those with distance <= limit, or > limit when not _inside.
+        self._inside = True
+        self._fixed_limit: Optional[int] = None
+        self._row_extreme = self._col_extreme = None
+
+    def set_subject_color(self, subject_color: Tuple[int, int, int], mode: str = 'color'):
+        subject_color = tuple(subject_color[:3])
+        if (subject_color, mode) == self._subject_key:
+            return
+        self._subject_key = (subject_color, mode)
+        self.subject_color = subject_color
+        self.mode = IconConverter.resolve_mode(mode, self._corners)
+        background = IconConverter._background_color(self._corners)
+        if self.mode == 'background' and background[3] == 0:
+            self.mode = 'alpha'
+
+        self._inside = self.mode in ('color', 'palette')
+        self._fixed_limit = IconConverter.ALPHA_THRESHOLD if self.mode == 'alpha' else None
+        if self.mode == 'alpha':
+            references = []
+        elif self.mode == 'background':
+            references = [background]
+        else:
+            references = [subject_color] + [color for color in self.palette
+                                            if self.mode == 'palette' and color != subject_color]
+
+        if _numpy() is not None:
+            pixels = np.asarray(self.proxy).astype(np.int32)
+            if self.mode == 'alpha':
+                self._distance = pixels[..., 3]
+            else:
+                self._distance = None
+                for reference in references:
+                    delta = pixels[..., :len(reference)] - np.asarray(reference, dtype=np.int32)
+                    distance = (delta * delta).sum(axis=2)
+                    self._distance = distance if self._distance is None else np.minimum(self._distance, distance)
+            # Per-row/column extremes turn every bbox lookup into two 1-D comparisons.
+            extreme = np.min if self._inside else np.max
+            self._row_extreme = extreme(self._distance, axis=1)
+            self._col_extreme = extreme(self._distance, axis=0)
+        elif self.mode == 'alpha':
+            self._distance = self.proxy.getchannel('A')
+        else:
+            self._distance = None
+            for reference in references:
+                distance = _squared_distance_map(self.proxy, reference)
+                if self._distance is None:
+                    self._distance = distance
+                else:
+                    self._distance = _image_math("min(d, e)", d=self._distance, e=distance)
+
+    def _limit(self, tolerance: int) -> int:
+        return self._fixed_limit if self._fixed_limit is not None else tolerance * tolerance
+
+    def mask(self, tolerance: int) -> Image.Image:
+        """'L' mask of the proxy pixels that count as subject at this tolerance."""
+        limit = self._limit(tolerance)
+        if _numpy() is not None:
+            subject = self._distance <= limit if self._inside else self._distance > limit
+            return Image.fromarray((subject * 255).astype(np.uint8), 'L')
+        comparison = "<=" if self._inside else ">"
+        mask = _image_math(f"convert(d {comparison} limit, 'L')", d=self._distance, limit=limit)
+        return mask.point(lambda v: 255 if v else 0)
+
+    def bbox(self, tolerance: int) -> Optional[Tuple[int, int, int, int]]:
+        """Bounding box of the subject in proxy coordinates."""
+        if _numpy() is None:
+            return self.mask(tolerance).getbbox()
+        limit = self._limit(tolerance)
+        if self._inside:
+            rows, cols = self._row_extreme <= limit, self._col_extreme <= limit
+        else:
+            rows, cols = self._row_extreme > limit, self._col_extreme > limit
+        rows = np.flatnonzero(rows)
+        if rows.size == 0:
+            return None
+        cols = np.flatnonzero(cols)
+        return int(cols[0]), int(rows[0]), int(cols[-1]) + 1, int(rows[-1]) + 1
+
+    def source_bbox(self, tolerance: int) -> Optional[Tuple[int, int, int, int]]:
+        """bbox() scaled to source coordinates. Approximate, because the proxy is resampled."""
+        bbox = self.bbox(tolerance)
+        if bbox is None:
+            return None
+        scale_x = self.source_size[0] / self.proxy.width
+        scale_y = self.source_size[1] / self.proxy.height
+        return (int(bbox[0] * scale_x), int(bbox[1] * scale_y),
+                min(self.source_size[0], math.ceil(bbox[2] * scale_x)),
+                min(self.source_size[1], math.ceil(bbox[3] * scale_y)))
+
+    def render(self, tolerance: int, outline: Tuple[int, int, int, int] = (255, 64, 64, 255)) -> Image.Image:
+        """The proxy with non-matching pixels dimmed and the crop rectangle outlined."""
+        preview = Image.composite(self.proxy, self._dimmed, self.mask(tolerance))
+        bbox = self.bbox(tolerance)
+        if bbox is not None:
+            ImageDraw.Draw(preview).rectangle((bbox[0], bbox[1], bbox[2] - 1, bbox[3] - 1), outline=outline)
+        return preview
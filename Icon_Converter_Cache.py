@@ -0,0 +1,186 @@
+# Icon_Converter_Cache.py
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+CACHE_KINDS = ('icon', 'bbox', 'color')
+
+
+def default_cache_dir() -> str:
+    base = os.environ.get('LOCALAPPDATA') or os.environ.get('XDG_CACHE_HOME') \
+        or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'IconMaster')
+
+
+def file_digest(path: str, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_key(*parts: Any) -> str:
+    """Stable hash of JSON-serializable parts (tuples and lists hash the same)."""
+    encoded = json.dumps(parts, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+class ConversionCache:
+    """
+    On-disk, content-addressed cache for conversion results.
+
+    Finished icons, crop bounding boxes and detected dominant colors are kept in separate
+    directories. That way a size-only change still reuses the bbox, and a repeated auto-detect
+    skips decoding. Every hit refreshes the entry's mtime, and the least recently used entries
+    are evicted once the cache grows past max_bytes. Writes go through a temporary file and
+    os.replace(), so several processes can share one cache directory, and the in-process
+    bookkeeping is locked, so several threads can share one ConversionCache.
+    """
+
+    def __init__(self, root: Optional[str] = None, max_bytes: int = 256 * 1024 * 1024, hardlink: bool = False):
+        self.root = root or default_cache_dir()
+        self.max_bytes = max_bytes
+        # Hard links save the copy, but writing to the output file in place would also change the cached file.
+        self.hardlink = hardlink
+        self.hits: Dict[str, int] = {kind: 0 for kind in CACHE_KINDS}
+        self.misses: Dict[str, int] = {kind: 0 for kind in CACHE_KINDS}
+        self._size_estimate: Optional[int] = None  # Bytes on disk, rescanned only when over max_bytes.
+        self._lock = threading.RLock()
+        for kind in CACHE_KINDS:
+            os.makedirs(os.path.join(self.root, kind), exist_ok=True)
+
+    def _path(self, kind: str, key: str) -> str:
+        extension = '.ico' if kind == 'icon' else '.json'
+        return os.path.join(self.root, kind, key + extension)
+
+    def _record(self, kind: str, hit: bool, path: str):
+        with self._lock:
+            if hit:
+                self.hits[kind] += 1
+            else:
+                self.misses[kind] += 1
+        if hit:
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+
+    def _write_atomic(self, path: str, data: bytes):
+        with self._lock:
+            if self._size_estimate is None:
+                self._size_estimate = self._scan()[1]
+            self._size_estimate += len(data)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.chmod(temp_path, 0o644)  # mkstemp() creates owner-only files; hard-linked icons need normal modes.
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def get_value(self, kind: str, key: str) -> Tuple[bool, Any]:
+        """Returns (hit, value). The value may itself be None, e.g. a bbox for an image with no subject."""
+        path = self._path(kind, key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                value = json.load(f)
+        except (OSError, ValueError):
+            self._record(kind, False, path)
+            return False, None
+        self._record(kind, True, path)
+        return True, value
+
+    def put_value(self, kind: str, key: str, value: Any):
+        self._write_atomic(self._path(kind, key), json.dumps(value).encode('utf-8'))
+        self.evict()
+
+    def fetch_icon(self, key: str, output_path: str) -> bool:
+        """Copies (or hard-links) the cached icon to output_path. Returns False on a miss."""
+        path = self._path('icon', key)
+        if not os.path.isfile(path):
+            self._record('icon', False, path)
+            return False
+        try:
+            if os.path.lexists(output_path):
+                os.remove(output_path)
+            if self.hardlink:
+                try:
+                    os.link(path, output_path)
+                except OSError:
+                    shutil.copyfile(path, output_path)
+            else:
+                shutil.copyfile(path, output_path)
+        except FileNotFoundError:  # Evicted by another process in the meantime.
+            self._record('icon', False, path)
+            return False
+        self._record('icon', True, path)
+        return True
+
+    def get_icon(self, key: str) -> Optional[bytes]:
+        """The cached icon's bytes, or None on a miss."""
+        path = self._path('icon', key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            self._record('icon', False, path)
+            return None
+        self._record('icon', True, path)
+        return data
+
+    def put_icon(self, key: str, data: bytes):
+        self._write_atomic(self._path('icon', key), data)
+        self.evict()
+
+    def _scan(self):
+        entries = []
+        total = 0
+        for kind in CACHE_KINDS:
+            directory = os.path.join(self.root, kind)
+            for entry in os.scandir(directory):
+                if not entry.is_file() or entry.name.endswith('.tmp'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        return entries, total
+
+    def evict(self):
+        """Removes least recently used entries until the cache fits in max_bytes."""
+        with self._lock:
+            self._evict()
+
+    def _evict(self):
+        if self._size_estimate is not None and self._size_estimate <= self.max_bytes:
+            return
+        entries, total = self._scan()
+        self._size_estimate = total
+        if total <= self.max_bytes:
+            return
+        for _, size, path in sorted(entries):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            if total <= self.max_bytes:
+                break
+        self._size_estimate = total
+        logging.info(f"Conversion cache trimmed to {total / (1024 * 1024):.1f} MiB.")
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {kind: {'hits': self.hits[kind], 'misses': self.misses[kind]} for kind in CACHE_KINDS}
@@ -0,0 +1,155 @@
+# Icon_Converter_Encoder.py
+
+import io
+import logging
+import math
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from PIL import Image
+
+from Icon_Converter_Metrics import ConversionMetrics
+
+Size = Tuple[int, int]
+
+RESAMPLING_FILTERS = {
+    'nearest': Image.Resampling.NEAREST,
+    'box': Image.Resampling.BOX,
+    'bilinear': Image.Resampling.BILINEAR,
+    'hamming': Image.Resampling.HAMMING,
+    'bicubic': Image.Resampling.BICUBIC,
+    'lanczos': Image.Resampling.LANCZOS,
+}
+
+
+def fit_size(source: Size, bounds: Size) -> Size:
+    """Largest size with the aspect ratio of source that fits in bounds, rounded like Image.thumbnail()."""
+    width, height = source
+    max_width, max_height = bounds
+    if width <= max_width and height <= max_height:
+        return width, height
+
+    aspect = width / height
+    if max_width / max_height >= aspect:
+        fitted_width = max(min(math.floor(max_height * aspect), math.ceil(max_height * aspect),
+                               key=lambda n: abs(aspect - n / max_height)), 1)
+        return fitted_width, max_height
+    fitted_height = max(min(math.floor(max_width / aspect), math.ceil(max_width / aspect),
+                            key=lambda n: 0 if n == 0 else abs(aspect - max_width / n)), 1)
+    return max_width, fitted_height
+
+
+class IconEncoder:
+    """
+    Writes multi-resolution .ico files.
+
+    Frames are built as a downscale pyramid: the largest frame is resampled from the source and every
+    smaller frame from the next larger one. Frames are then encoded in parallel. Frames whose longest
+    side is at least png_min_size are stored as PNG; smaller ones are stored as uncompressed 32-bit
+    BMP/DIB, which is much faster to write.
+    """
+    MAX_ICON_SIZE = 256
+
+    def __init__(self, resample: Union[str, int] = 'lanczos', png_min_size: int = 256,
+                 png_compress_level: int = 6, max_workers: Optional[int] = None):
+        if isinstance(resample, str):
+            if resample not in RESAMPLING_FILTERS:
+                raise ValueError(f"Unknown resampling filter: {resample!r}")
+            resample = RESAMPLING_FILTERS[resample]
+        self.resample = resample
+        self.png_min_size = png_min_size
+        self.png_compress_level = png_compress_level
+        self.max_workers = max_workers
+
+    def settings(self) -> Dict[str, int]:
+        """Everything besides the image and sizes that affects the encoded bytes."""
+        return {'resample': int(self.resample), 'png_min_size': self.png_min_size,
+                'png_compress_level': self.png_compress_level}
+
+    def validate_sizes(self, sizes: Sequence[Size]) -> List[Size]:
+        unique = sorted({(int(w), int(h)) for w, h in sizes})
+        for width, height in unique:
+            if not (1 <= width <= self.MAX_ICON_SIZE and 1 <= height <= self.MAX_ICON_SIZE):
+                raise ValueError(f"Icon sizes must be between 1 and {self.MAX_ICON_SIZE}, got {width}x{height}")
+        return unique
+
+    def build_pyramid(self, img: Image.Image, sizes: Sequence[Size]) -> List[Image.Image]:
+        """
+        Resized frames for every requested size, smallest first.
+
+        Like Pillow's ICO writer, sizes larger than the image are skipped and frames keep the image's
+        aspect ratio.
+        """
+        if img.mode != 'RGBA':
+            img = img.convert('RGBA')
+
+        targets = {}
+        for size in self.validate_sizes(sizes):
+            if size[0] > img.width or size[1] > img.height:
+                continue
+            targets.setdefault(fit_size(img.size, size), size)
+
+        frames = []
+        previous = img
+        for frame_size in sorted(targets, reverse=True):
+            if previous.size != frame_size:
+                # Only the first step starts from the full-resolution source, where reducing_gap
+                # lets Pillow shrink by an integer factor first.
+                reducing_gap = 3.0 if previous is img else None
+                previous = previous.resize(frame_size, self.resample, reducing_gap=reducing_gap)
+            frames.append(previous)
+        frames.reverse()
+        return frames
+
+    def encode_frame(self, frame: Image.Image) -> bytes:
+        if max(frame.size) >= self.png_min_size:
+            buffer = io.BytesIO()
+            frame.save(buffer, format='PNG', compress_level=self.png_compress_level)
+            return buffer.getvalue()
+        return self._encode_dib(frame)
+
+    @staticmethod
+    def _encode_dib(frame: Image.Image) -> bytes:
+        buffer = io.BytesIO()
+        frame.save(buffer, format='DIB')
+        data = bytearray(buffer.getvalue())
+        # ICO DIBs declare the XOR bitmap plus the AND mask in biHeight, hence twice the height.
+        struct.pack_into('<i', data, 8, frame.height * 2)
+        # All-zero AND mask: for 32-bit frames transparency comes from the alpha channel.
+        mask_row_bytes = ((frame.width + 31) // 32) * 4
+        data += bytes(mask_row_bytes * frame.height)
+        return bytes(data)
+
+    def encode(self, img: Image.Image, sizes: Sequence[Size], metrics: Optional[ConversionMetrics] = None) -> bytes:
+        """Builds the .ico file in memory. With metrics, the 'resize' and 'encode' stages are timed."""
+        metrics = metrics or ConversionMetrics()
+        with metrics.stage('resize'):
+            frames = self.build_pyramid(img, sizes)
+        if not frames:
+            raise ValueError(f"Image of size {img.size} is smaller than every requested icon size")
+
+        workers = self.max_workers or min(len(frames), os.cpu_count() or 1)
+        with metrics.stage('encode'):
+            if workers > 1:
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    payloads = list(executor.map(self.encode_frame, frames))
+            else:
+                payloads = [self.encode_frame(frame) for frame in frames]
+
+        header = struct.pack('<HHH', 0, 1, len(frames))
+        entries = []
+        offset = len(header) + 16 * len(frames)
+        for frame, payload in zip(frames, payloads):
+            width, height = frame.size
+            # A stored width/height of 0 means 256.
+            entries.append(struct.pack('<BBBBHHII', width % 256, height % 256, 0, 0, 1, 32, len(payload), offset))
+            offset += len(payload)
+
+        formats: Dict[str, int] = {}
+        for payload in payloads:
+            kind = 'PNG' if payload.startswith(b'\x89PNG') else 'BMP'
+            formats[kind] = formats.get(kind, 0) + 1
+        logging.info(f"Encoded {len(frames)} icon frames ({', '.join(f'{n} {k}' for k, n in formats.items())}).")
+        return header + b''.join(entries) + b''.join(payloads)
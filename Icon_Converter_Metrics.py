@@ -0,0 +1,128 @@
+# Icon_Converter_Metrics.py
+
+import cProfile
+import io
+import logging
+import pstats
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Sequence
+
+# stage_callback(stage, seconds) is called every time a stage finishes.
+StageCallback = Callable[[str, float], None]
+
+
+class ConversionMetrics:
+    """
+    Wall-clock seconds spent in each converter stage, in the order the stages first ran.
+
+    A stage entered several times (e.g. 'mask' once per strip) accumulates. Stages never nest,
+    so total is the sum of all of them. counters holds sizes such as pixels scanned or bytes
+    written.
+    """
+
+    def __init__(self, callbacks: Sequence[StageCallback] = ()):
+        self.stages: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {}
+        self.callbacks: List[StageCallback] = list(callbacks)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.stages[name] = self.stages.get(name, 0.0) + elapsed
+            for callback in self.callbacks:
+                callback(name, elapsed)
+
+    def count(self, name: str, value: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    @property
+    def total(self) -> float:
+        return sum(self.stages.values())
+
+    def merge(self, other: 'ConversionMetrics'):
+        """Adds the stages and counters of other, e.g. a detection run, to this one."""
+        for name, seconds in other.stages.items():
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+        for name, value in other.counters.items():
+            self.count(name, value)
+
+    def as_dict(self) -> Dict[str, Dict]:
+        return {'stages': dict(self.stages), 'counters': dict(self.counters)}
+
+    def summary(self) -> str:
+        return ", ".join(f"{name} {seconds * 1000:.1f} ms" for name, seconds in self.stages.items())
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """q-th percentile (0-100) with linear interpolation between the closest ranks."""
+    ordered = sorted(values)
+    if not ordered:
+        raise ValueError("percentile() of an empty sequence")
+    position = (len(ordered) - 1) * q / 100.0
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def aggregate_stages(runs: Iterable[Dict[str, float]],
+                     quantiles: Sequence[float] = (50, 95)) -> Dict[str, Dict[str, float]]:
+    """
+    Per-stage statistics over many runs: {stage: {'count': n, 'p50': s, 'p95': s, 'max': s}}.
+
+    Each run is a {stage: seconds} mapping; a stage is only counted for the runs it appeared in.
+    """
+    samples: Dict[str, List[float]] = {}
+    for stages in runs:
+        for name, seconds in stages.items():
+            samples.setdefault(name, []).append(seconds)
+    statistics = {}
+    for name, values in samples.items():
+        statistics[name] = {'count': len(values)}
+        for q in quantiles:
+            statistics[name][f"p{q:g}"] = percentile(values, q)
+        statistics[name]['max'] = max(values)
+    return statistics
+
+
+@contextmanager
+def profiled(path_prefix: str, top: int = 30) -> Iterator[None]:
+    """
+    Runs the block under cProfile and tracemalloc.
+
+    Writes path_prefix + '.prof' (open with pstats or snakeviz) and a readable path_prefix + '.txt'
+    with the slowest functions, the traced memory peak and the lines holding the most memory at the
+    end. tracemalloc sees Python and NumPy allocations, not Pillow's own image buffers.
+    """
+    profiler = cProfile.Profile()
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    elif hasattr(tracemalloc, 'reset_peak'):  # Python 3.9+; on 3.8 the peak also covers earlier tracing.
+        tracemalloc.reset_peak()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        if started_tracing:
+            tracemalloc.stop()
+
+        profiler.dump_stats(path_prefix + '.prof')
+        report = io.StringIO()
+        report.write(f"Traced memory: {current / (1024 * 1024):.1f} MiB at exit, "
+                     f"{peak / (1024 * 1024):.1f} MiB peak\n\n")
+        pstats.Stats(profiler, stream=report).sort_stats('cumulative').print_stats(top)
+        report.write(f"Top {top} allocation sites still alive at exit:\n")
+        for statistic in snapshot.statistics('lineno')[:top]:
+            report.write(f"{statistic}\n")
+        with open(path_prefix + '.txt', 'w', encoding='utf-8') as f:
+            f.write(report.getvalue())
+        logging.info(f"Profile written to {path_prefix}.prof and {path_prefix}.txt")
@@ -0,0 +1,208 @@
+# Icon_Converter_Streaming.py
+
+import logging
+from typing import Iterator, List, Optional, Tuple
+
+from PIL import Image
+
+Box = Tuple[int, int, int, int]
+# (extents within the band, file offset, rawmode, stride, orientation)
+RawTile = Tuple[Box, int, str, int, int]
+# Modes kept as decoded when an image cannot be read in strips; others are converted to RGBA.
+NATIVE_MODES = ('L', 'LA', 'RGB', 'RGBA')
+
+
+class StreamingSource:
+    """
+    Reads a large image in horizontal strips instead of one fully decoded RGBA copy.
+
+    Formats that store uncompressed rows at known file offsets (uncompressed TIFF, BMP, PPM and
+    similar) are read strip by strip. Peak memory is then about band_rows * width * 4 bytes,
+    whatever the image height. PNG, JPEG and compressed TIFF are
+    stored as a single compressed stream, which Pillow can only decode in full. For those the
+    image is decoded once in its own mode, without the extra RGBA copy. JPEG detection passes
+    additionally use draft() to decode at reduced scale.
+    """
+
+    def __init__(self, path: str, band_rows: int = 256):
+        self.path = path
+        self.band_rows = band_rows
+        with Image.open(path) as img:
+            self.size = img.size
+            self.mode = img.mode
+            self.format = img.format
+            self._band_tiles = self._plan_bands(img)
+        self._native: Optional[Image.Image] = None
+
+    @property
+    def width(self) -> int:
+        return self.size[0]
+
+    @property
+    def height(self) -> int:
+        return self.size[1]
+
+    @property
+    def banded(self) -> bool:
+        """True when strips are decoded independently, i.e. memory does not grow with the height."""
+        return self._band_tiles is not None
+
+    @property
+    def saves_memory(self) -> bool:
+        """False when the source would be held as full-size RGBA anyway, so streaming cannot help."""
+        return self.banded or self.mode in ('L', 'LA', 'RGB')
+
+    def _plan_bands(self, img: Image.Image) -> Optional[List[Tuple[int, int, List[RawTile]]]]:
+        """
+        Groups the file's raw tiles into bands of about band_rows rows.
+
+        Returns None when the pixel data cannot be read piecewise: compressed or palette images,
+        multi-frame files or tile layouts with gaps.
+        """
+        tiles = list(img.tile)
+        if getattr(img, 'n_frames', 1) != 1 or not tiles or img.mode in ('P', 'PA'):
+            return None
+        if any(codec != 'raw' for codec, _, _, _ in tiles):
+            return None
+        width, height = img.size
+
+        raw_tiles = []
+        for _, extents, offset, args in tiles:
+            if not isinstance(args, tuple):
+                args = (args,)
+            rawmode, stride, orientation = (tuple(args) + (0, 1))[:3]
+            tile_width = extents[2] - extents[0]
+            if not stride:
+                try:
+                    stride = tile_width * len(Image.new(rawmode, (1, 1)).tobytes())
+                except (ValueError, TypeError):
+                    return None
+            raw_tiles.append((tuple(extents), offset, rawmode, stride, orientation))
+
+        if len(raw_tiles) == 1:
+            extents, offset, rawmode, stride, orientation = raw_tiles[0]
+            if extents != (0, 0, width, height):
+                return None
+            # One contiguous block of rows: cut it into bands ourselves.
+            plan = []
+            for top in range(0, height, self.band_rows):
+                bottom = min(top + self.band_rows, height)
+                # Bottom-up files (orientation -1, e.g. BMP) store the last row first.
+                first_row = top if orientation >= 0 else height - bottom
+                plan.append((top, bottom, [((0, 0, width, bottom - top), offset + first_row * stride,
+                                            rawmode, stride, orientation)]))
+            return plan
+
+        # Several strips or TIFF tiles: group them into bands by the rows they cover.
+        rows = sorted({(extents[1], extents[3]) for extents, _, _, _, _ in raw_tiles})
+        plan = []
+        for top, bottom in rows:
+            if plan and plan[-1][1] == top and bottom - plan[-1][0] <= self.band_rows:
+                plan[-1] = (plan[-1][0], bottom, plan[-1][2])
+            elif plan and plan[-1][1] != top:
+                return None  # Overlapping or missing rows
+            else:
+                plan.append((top, bottom, []))
+        if plan[0][0] != 0 or plan[-1][1] != height:
+            return None
+        for band_top, band_bottom, band_tiles in plan:
+            for (x0, y0, x1, y1), offset, rawmode, stride, orientation in raw_tiles:
+                if band_top <= y0 and y1 <= band_bottom:
+                    band_tiles.append(((x0, y0 - band_top, x1, y1 - band_top), offset, rawmode, stride, orientation))
+        return plan
+
+    def _load_band(self, top: int, bottom: int, tiles: List[RawTile], box: Optional[Box] = None) -> Image.Image:
+        """Reads rows top..bottom straight from the file, or only box within them, as RGBA."""
+        band = Image.new(self.mode, (self.width, bottom - top))
+        with open(self.path, 'rb') as f:
+            for (x0, y0, x1, y1), offset, rawmode, stride, orientation in tiles:
+                f.seek(offset)
+                data = f.read(stride * (y1 - y0))
+                piece = Image.frombytes(self.mode, (x1 - x0, y1 - y0), data, 'raw', rawmode, stride, orientation)
+                band.paste(piece, (x0, y0))
+        return (band.crop(box) if box else band).convert('RGBA')
+
+    def _native_image(self) -> Image.Image:
+        if self._native is None:
+            img = Image.open(self.path)
+            try:
+                img.load()  # Closes the file of single-frame images, keeping the decoded pixels.
+                logging.info(f"Source decoded in full as {img.mode}; {self.format} cannot be read in strips.")
+                if img.mode in NATIVE_MODES and getattr(img, 'n_frames', 1) == 1:
+                    self._native = img  # No copy(): that would hold the pixels twice at peak.
+                else:
+                    # reduce() only handles the common modes; palette and 16-bit images go through RGBA.
+                    self._native = img.convert('RGBA')
+            finally:
+                if self._native is not img:
+                    img.close()
+        return self._native
+
+    def bands(self) -> Iterator[Tuple[int, Image.Image]]:
+        """Yields (top, band) for consecutive RGBA strips that together cover the image."""
+        if self._band_tiles is not None:
+            for top, bottom, tiles in self._band_tiles:
+                yield top, self._load_band(top, bottom, tiles)
+            return
+        native = self._native_image()
+        for top in range(0, self.height, self.band_rows):
+            bottom = min(top + self.band_rows, self.height)
+            yield top, native.crop((0, top, self.width, bottom)).convert('RGBA')
+
+    def region(self, box: Box, min_size: Optional[Tuple[int, int]] = None) -> Image.Image:
+        """
+        Materializes only box, as RGBA.
+
+        With min_size, the region is also shrunk by the largest integer factor that keeps it at least
+        min_size, band by band, so a huge crop never exists at full resolution.
+        """
+        left, top, right, bottom = box
+        width, height = right - left, bottom - top
+        factor = 1
+        if min_size:
+            factor = max(1, min(width // min_size[0], height // min_size[1]))
+        out_width, out_height = -(-width // factor), -(-height // factor)
+
+        if self._band_tiles is None:
+            native = self._native_image()
+            region = native.crop(box) if factor == 1 else native.reduce(factor, box=box)
+            return region.convert('RGBA')
+
+        region = Image.new('RGBA', (out_width, out_height))
+        for band_top, band_bottom, tiles in self._band_tiles:
+            if band_bottom <= top or band_top >= bottom:
+                continue
+            y0, y1 = max(top, band_top), min(bottom, band_bottom)
+            piece = self._load_band(band_top, band_bottom, tiles, (left, y0 - band_top, right, y1 - band_top))
+            # Map band rows onto output rows exactly, whatever the band boundaries.
+            out_y0, out_y1 = (y0 - top) * out_height // height, (y1 - top) * out_height // height
+            if factor > 1 and out_y1 > out_y0:
+                piece = piece.resize((out_width, out_y1 - out_y0), Image.Resampling.BOX)
+            if out_y1 > out_y0:
+                region.paste(piece, (0, out_y0))
+        return region
+
+    def corners(self) -> List[Tuple[int, ...]]:
+        """RGBA values of the four corner pixels."""
+        right, bottom = self.width - 1, self.height - 1
+        top_row = self.region((0, 0, self.width, 1))
+        bottom_row = self.region((0, bottom, self.width, bottom + 1))
+        return [top_row.getpixel((0, 0)), top_row.getpixel((right, 0)),
+                bottom_row.getpixel((0, 0)), bottom_row.getpixel((right, 0))]
+
+    def reduced(self, max_size: Tuple[int, int]) -> Image.Image:
+        """An RGBA copy reduced to at least twice max_size, for detection passes."""
+        factor = max(1, min(self.width // max_size[0], self.height // max_size[1]) // 2)
+
+        if self.format == 'JPEG' and self._native is None:
+            with Image.open(self.path) as img:
+                img.draft('RGB', (self.width // factor, self.height // factor))
+                return img.convert('RGBA')
+
+        if self._band_tiles is None:
+            return self._native_image().reduce(factor).convert('RGBA')
+
+        return self.region((0, 0) + self.size, (max_size[0] * 2, max_size[1] * 2))
+
+    def close(self):
+        self._native = None
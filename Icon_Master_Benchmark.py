@@ -0,0 +1,288 @@
+# Icon_Master_Benchmark.py
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image, ImageDraw, __version__ as PILLOW_VERSION
+
+import Icon_Converter_Algorithm
+from Icon_Converter_Algorithm import IconConverter
+
+SCENARIOS = ('solid', 'gradient', 'alpha', 'noise')
+DEFAULT_SIZES = (256, 1024, 4096)
+STAGES = ('decode', 'detect', 'crop', 'encode')
+
+SUBJECT_COLOR = (66, 214, 255)
+ACCENT_COLOR = (200, 40, 40)
+TOLERANCE = 60
+PALETTE = [ACCENT_COLOR]  # For the 'palette' golden checks
+
+
+def make_image(scenario: str, size: int) -> Tuple[Image.Image, Tuple[int, int, int, int]]:
+    """
+    Builds a synthetic input and the bbox its subject must be cropped to.
+
+    Every scenario places a SUBJECT_COLOR rectangle with an ACCENT_COLOR disc inside it on a
+    background that is far from the subject color, so bbox and dominant color are known exactly.
+    """
+    bbox = (size // 4, size * 3 // 10, size * 3 // 4, size * 7 // 10)
+
+    if scenario == 'solid':
+        img = Image.new('RGBA', (size, size), (255, 255, 255, 255))
+    elif scenario == 'gradient':
+        ramp = Image.linear_gradient('L').resize((size, size))
+        light = Image.new('RGBA', (size, size), (240, 240, 255, 255))
+        dark = Image.new('RGBA', (size, size), (180, 180, 200, 255))
+        img = Image.composite(dark, light, ramp)
+    elif scenario == 'alpha':
+        img = Image.new('RGBA', (size, size), (0, 0, 0, 0))
+        glow = max(1, size // 32)
+        ImageDraw.Draw(img).rectangle((bbox[0] - glow, bbox[1] - glow, bbox[2] + glow - 1, bbox[3] + glow - 1),
+                                      fill=(255, 255, 255, 80))
+    elif scenario == 'noise':
+        # Grey, photo-like grain: effect_noise() is native, so even 8K inputs are generated quickly.
+        grain = Image.effect_noise((size, size), 40).convert('RGB')
+        img = grain.convert('RGBA')
+    else:
+        raise ValueError(f"Unknown scenario: {scenario!r}")
+
+    draw = ImageDraw.Draw(img)
+    draw.rectangle((bbox[0], bbox[1], bbox[2] - 1, bbox[3] - 1), fill=SUBJECT_COLOR + (255,))
+    inset = (bbox[3] - bbox[1]) // 4
+    draw.ellipse((bbox[0] + inset, bbox[1] + inset, bbox[0] + 3 * inset, bbox[1] + 3 * inset),
+                 fill=ACCENT_COLOR + (255,))
+    return img, bbox
+
+
+def expected_crops(scenario: str, size: int,
+                   bbox: Tuple[int, int, int, int]) -> Dict[str, Optional[Tuple[int, int, int, int]]]:
+    """
+    The bbox each subject mode must crop a make_image() input to. None marks modes with no
+    well-defined answer for the scenario (the gradient or grain is not a uniform background); those
+    are only checked for giving the same bbox on every engine, with and without streaming.
+
+    'palette' is run with PALETTE, so the disc counts as subject too and the rectangle still bounds it.
+    """
+    if scenario == 'alpha':
+        glow = max(1, size // 32)
+        halo = (bbox[0] - glow, bbox[1] - glow, bbox[2] + glow, bbox[3] + glow)
+        return {'color': bbox, 'auto': halo, 'alpha': halo, 'background': halo, 'palette': bbox}
+    return {'color': bbox, 'auto': bbox, 'alpha': (0, 0, size, size),
+            'background': bbox if scenario == 'solid' else None, 'palette': bbox}
+
+
+def _peak_rss_mib() -> Optional[float]:
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Kilobytes on Linux, bytes on macOS.
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / (1024 * 1024)
+    except (ImportError, AttributeError):
+        return None
+
+
+def _best_of(repeat: int, func):
+    best, result = None, None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def check_variants(scenario: str, size: int, path: str, expected_bbox: Tuple[int, int, int, int]) -> List[Dict]:
+    """
+    Golden checks beyond the timed run: every dominant color method, and every subject mode with and
+    without streaming, on NumPy and on the pure-Pillow fallback. Each must match the known answer,
+    or where there is none, the NumPy in-memory result.
+    """
+    numpy_module = Icon_Converter_Algorithm._numpy()
+    engines = [('numpy', numpy_module)] if numpy_module is not None else []
+    engines.append(('pillow', None))
+    expected = expected_crops(scenario, size, expected_bbox)
+    reference: Dict[str, Optional[Tuple[int, int, int, int]]] = {}
+    checks = []
+    try:
+        for engine, module in engines:
+            Icon_Converter_Algorithm.np = module
+            for method in IconConverter.DOMINANT_COLOR_METHODS:
+                with IconConverter(path) as converter:
+                    color = converter.find_dominant_color(method)
+                checks.append({'check': f"{engine}/{method}", 'result': list(color) if color else None,
+                               'expected': list(SUBJECT_COLOR), 'ok': color == SUBJECT_COLOR})
+            for streaming in (False, True):
+                for mode, bbox in expected.items():
+                    with IconConverter(path, streaming=streaming) as converter:
+                        converter.convert_to_bytes(SUBJECT_COLOR, TOLERANCE, mode=mode,
+                                                   palette=PALETTE if mode == 'palette' else None)
+                    want = bbox or reference.setdefault(mode, converter.bbox)
+                    checks.append({'check': f"{engine}/{'streaming' if streaming else 'in-memory'}/{mode}",
+                                   'result': list(converter.bbox) if converter.bbox else None,
+                                   'expected': list(want) if want else None, 'ok': converter.bbox == want})
+    finally:
+        Icon_Converter_Algorithm.np = numpy_module
+    return checks
+
+
+def run_case(scenario: str, size: int, path: str, expected_bbox: Tuple[int, int, int, int], repeat: int) -> Dict:
+    """
+    Times each IconConverter stage on one synthetic input, then runs check_variants(). Runs in a
+    fresh process to isolate peak RSS.
+    """
+    logging.disable(logging.CRITICAL)
+    Icon_Converter_Algorithm._numpy()  # Imported on first use; keep that out of the detect timing.
+    baseline_rss = _peak_rss_mib()
+
+    def decode():
+        converter = IconConverter(path)
+        converter.rgba
+        return converter
+
+    seconds = {}
+    seconds['decode'], converter = _best_of(repeat, decode)
+    seconds['detect'], color = _best_of(repeat, converter.find_dominant_color)
+    seconds['crop'], cropped = _best_of(
+        repeat, lambda: converter._crop_to_subject(converter.rgba, SUBJECT_COLOR, TOLERANCE))
+    seconds['encode'], ico = _best_of(repeat, lambda: converter.encoder.encode(cropped, IconConverter.TARGET_SIZES))
+
+    pixels = size * size
+    peak_rss = _peak_rss_mib()
+    variants = check_variants(scenario, size, path, expected_bbox)
+    return {
+        'scenario': scenario,
+        'size': size,
+        'megapixels': pixels / 1e6,
+        'stages': {stage: {'seconds': seconds[stage], 'mpix_per_s': pixels / 1e6 / seconds[stage]}
+                   for stage in STAGES},
+        'peak_rss_mib': peak_rss,
+        'baseline_rss_mib': baseline_rss,
+        'ico_bytes': len(ico),
+        'golden': {
+            'bbox': list(converter.bbox) if converter.bbox else None,
+            'expected_bbox': list(expected_bbox),
+            'color': list(color) if color else None,
+            'expected_color': list(SUBJECT_COLOR),
+            'variants': variants,
+            'ok': converter.bbox == expected_bbox and color == SUBJECT_COLOR and all(v['ok'] for v in variants),
+        },
+    }
+
+
+def compare(results: Dict, baseline: Dict, threshold: float, min_seconds: float = 0.002) -> List[str]:
+    """Stages that got slower than baseline by more than threshold (ignoring sub-min_seconds noise)."""
+    previous = {(case['scenario'], case['size']): case for case in baseline['cases']}
+    regressions = []
+    for case in results['cases']:
+        old = previous.get((case['scenario'], case['size']))
+        if old is None:
+            continue
+        for stage in STAGES:
+            new_s, old_s = case['stages'][stage]['seconds'], old['stages'][stage]['seconds']
+            if new_s > old_s * (1 + threshold) and new_s - old_s > min_seconds:
+                regressions.append(f"{case['scenario']}/{case['size']} {stage}: "
+                                   f"{old_s * 1000:.1f} ms -> {new_s * 1000:.1f} ms (+{(new_s / old_s - 1) * 100:.0f}%)")
+    return regressions
+
+
+def print_report(results: Dict):
+    print(f"{'case':<16}" + "".join(f"{stage + ' ms':>12}{'MP/s':>8}" for stage in STAGES)
+          + f"{'RSS MiB':>9}{'ico KB':>8}  golden")
+    for case in results['cases']:
+        row = f"{case['scenario'] + '/' + str(case['size']):<16}"
+        for stage in STAGES:
+            timing = case['stages'][stage]
+            row += f"{timing['seconds'] * 1000:>12.1f}{timing['mpix_per_s']:>8.1f}"
+        rss = case['peak_rss_mib']
+        row += f"{rss:>9.0f}" if rss is not None else f"{'n/a':>9}"
+        row += f"{case['ico_bytes'] / 1024:>8.1f}  {'ok' if case['golden']['ok'] else 'FAILED'}"
+        print(row)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="Icon_Master_Benchmark",
+        description="Benchmark the IconConverter stages on synthetic inputs and check their results.")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help=f"Comma-separated subset of {', '.join(SCENARIOS)}.")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="Comma-separated square input sizes in pixels, e.g. 256,1024,4096,8192.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per stage; the fastest is reported.")
+    parser.add_argument("-o", "--output", metavar="JSON", help="Save the results to this file.")
+    parser.add_argument("--compare", metavar="JSON", help="Baseline results to check for regressions.")
+    parser.add_argument("--threshold", type=float, default=0.15,
+                        help="Allowed slowdown against --compare before failing (default: 0.15 = 15%%).")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    scenarios = [s.strip() for s in args.scenarios.split(',') if s.strip()]
+    sizes = [int(s) for s in args.sizes.split(',') if s.strip()]
+
+    results = {
+        'meta': {
+            'python': platform.python_version(),
+            'pillow': PILLOW_VERSION,
+            'numpy': getattr(Icon_Converter_Algorithm._numpy(), '__version__', None),
+            'platform': platform.platform(),
+            'repeat': args.repeat,
+        },
+        'cases': [],
+    }
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory(prefix="iconmaster-bench-") as workdir:
+        for size in sizes:
+            for scenario in scenarios:
+                img, expected_bbox = make_image(scenario, size)
+                path = os.path.join(workdir, f"{scenario}_{size}.png")
+                img.save(path)
+                del img
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                    case = executor.submit(run_case, scenario, size, path, expected_bbox, args.repeat).result()
+                results['cases'].append(case)
+                print(f"{scenario}/{size} done", file=sys.stderr)
+
+    print_report(results)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    failed = [case for case in results['cases'] if not case['golden']['ok']]
+    for case in failed:
+        golden = case['golden']
+        print(f"GOLDEN MISMATCH {case['scenario']}/{case['size']}: bbox {golden['bbox']} "
+              f"(expected {golden['expected_bbox']}), color {golden['color']} "
+              f"(expected {golden['expected_color']})", file=sys.stderr)
+        for variant in golden['variants']:
+            if not variant['ok']:
+                print(f"  {variant['check']}: {variant['result']} (expected {variant['expected']})", file=sys.stderr)
+
+    regressions = []
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if not regressions:
+            print(f"No stage slower than {args.compare} by more than {args.threshold:.0%}.", file=sys.stderr)
+
+    return 1 if failed or regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
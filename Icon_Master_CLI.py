@@ -0,0 +1,391 @@
+# Icon_Master_CLI.py
+
+import argparse
+import glob
+import json
+import logging
+import os
+import sys
+import time
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, asdict, field
+from typing import Dict, List, Optional, Tuple
+
+from Icon_Converter_Algorithm import IconConverter, IMAGE_EXTENSIONS
+from Icon_Converter_Cache import ConversionCache, CACHE_KINDS
+from Icon_Converter_Encoder import IconEncoder, RESAMPLING_FILTERS
+from Icon_Converter_Metrics import ConversionMetrics, aggregate_stages, profiled
+
+DEFAULT_COLOR = "#42D6FF"
+DEFAULT_TOLERANCE = 120
+
+
+@dataclass
+class ConversionJob:
+    input_path: str
+    output_path: str
+    color: str = DEFAULT_COLOR  # "#RRGGBB" or "auto"
+    tolerance: int = DEFAULT_TOLERANCE
+    mode: str = 'color'  # One of IconConverter.SUBJECT_MODES
+    sizes: Optional[List[Tuple[int, int]]] = None  # IconConverter.TARGET_SIZES when None
+    encoder: IconEncoder = field(default_factory=IconEncoder)
+    cache_dir: Optional[str] = None  # No caching when None
+    cache_max_bytes: int = 256 * 1024 * 1024
+    hardlink: bool = False
+    streaming: Optional[bool] = None  # Chosen from the image size when None
+    profile_prefix: Optional[str] = None  # Write cProfile/tracemalloc reports to <prefix>.prof/.txt when set
+
+
+@dataclass
+class ConversionResult:
+    input_path: str
+    output_path: str
+    ok: bool
+    error: Optional[str] = None
+    subject_color: Optional[Tuple[int, int, int]] = None
+    mode: Optional[str] = None  # Subject mode actually used, with 'auto' resolved
+    bbox: Optional[Tuple[int, int, int, int]] = None
+    timings: Dict[str, float] = field(default_factory=dict)
+    stages: Dict[str, float] = field(default_factory=dict)  # Seconds per converter stage
+    counters: Dict[str, int] = field(default_factory=dict)
+    cache: Dict[str, Dict[str, int]] = field(default_factory=dict)
+
+
+def parse_color(value: str) -> Tuple[int, int, int]:
+    color_hex = value.strip().lstrip('#')
+    if len(color_hex) != 6:
+        raise ValueError(f"Expected a color like #42D6FF, got {value!r}")
+    return tuple(int(color_hex[i:i + 2], 16) for i in (0, 2, 4))
+
+
+def available_cpus() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # Not available on Windows/macOS
+        return os.cpu_count() or 1
+
+
+def collect_inputs(patterns: List[str], recursive: bool = False) -> List[str]:
+    """Expands files, directories and glob patterns into a sorted, de-duplicated list of images."""
+    found = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            walker = os.walk(pattern) if recursive else [(pattern, [], os.listdir(pattern))]
+            for root, _, names in walker:
+                found.extend(os.path.join(root, name) for name in names
+                             if name.lower().endswith(IMAGE_EXTENSIONS))
+        elif os.path.isfile(pattern):
+            found.append(pattern)
+        else:
+            found.extend(path for path in glob.glob(pattern, recursive=recursive) if os.path.isfile(path))
+    return sorted({os.path.abspath(path) for path in found})
+
+
+def load_overrides(path: Optional[str]) -> Dict[str, dict]:
+    """
+    Reads per-file settings from a JSON object mapping a file name, relative or absolute path
+    to {"color": "#RRGGBB" | "auto", "tolerance": int, "mode": str}.
+    """
+    if not path:
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    base = os.path.dirname(os.path.abspath(path))
+    overrides = {}
+    for key, settings in data.items():
+        overrides[key] = settings
+        overrides[os.path.abspath(os.path.join(base, key))] = settings
+    return overrides
+
+
+def parse_sizes(value: str) -> List[Tuple[int, int]]:
+    """Parses '16,32,48x48' into [(16, 16), (32, 32), (48, 48)]."""
+    sizes = []
+    for item in value.split(','):
+        width, _, height = item.strip().lower().partition('x')
+        sizes.append((int(width), int(height or width)))
+    return sizes
+
+
+def build_jobs(inputs: List[str], color: str, tolerance: int, output_dir: Optional[str],
+               overrides: Dict[str, dict], sizes: Optional[List[Tuple[int, int]]] = None,
+               encoder: Optional[IconEncoder] = None, cache_dir: Optional[str] = None,
+               cache_max_bytes: int = 256 * 1024 * 1024, hardlink: bool = False,
+               streaming: Optional[bool] = None, profile_dir: Optional[str] = None,
+               mode: str = 'color', base_dir: Optional[str] = None) -> List[ConversionJob]:
+    """
+    One job per input. Under output_dir (and profile_dir), each input keeps its directory relative
+    to base_dir, by default the inputs' common directory, so a/icon.png and b/icon.png do not collide.
+    """
+    encoder = encoder or IconEncoder()
+    if base_dir is None and inputs:
+        try:
+            base_dir = os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in inputs])
+        except ValueError:  # Inputs on different drives
+            base_dir = None
+    jobs = []
+    for input_path in inputs:
+        settings = overrides.get(input_path) or overrides.get(os.path.basename(input_path)) or {}
+        stem = os.path.splitext(os.path.basename(input_path))[0]
+        relative_dir = ''
+        if base_dir:
+            relative_dir = os.path.relpath(os.path.dirname(os.path.abspath(input_path)), base_dir)
+            if relative_dir.startswith(os.pardir):
+                relative_dir = ''
+        directory = os.path.join(output_dir, relative_dir) if output_dir else os.path.dirname(input_path)
+        jobs.append(ConversionJob(
+            input_path=input_path,
+            output_path=os.path.normpath(os.path.join(directory, stem + ".ico")),
+            color=settings.get("color", color),
+            tolerance=int(settings.get("tolerance", tolerance)),
+            mode=settings.get("mode", mode),
+            sizes=sizes,
+            encoder=encoder,
+            cache_dir=cache_dir,
+            cache_max_bytes=cache_max_bytes,
+            hardlink=hardlink,
+            streaming=streaming,
+            profile_prefix=os.path.normpath(os.path.join(profile_dir, relative_dir, stem)) if profile_dir else None,
+        ))
+    return jobs
+
+
+def output_key(path: str) -> str:
+    """Compares output paths the way the file system will."""
+    return os.path.normcase(os.path.abspath(path))
+
+
+def split_output_collisions(jobs: List[ConversionJob]) -> Tuple[List[ConversionJob], List[ConversionResult]]:
+    """
+    Keeps the first job for every output path and fails the others, e.g. icon.jpg next to icon.png,
+    instead of letting parallel workers overwrite each other's icons.
+    """
+    owners: Dict[str, ConversionJob] = {}
+    kept, collisions = [], []
+    for job in jobs:
+        key = output_key(job.output_path)
+        if key in owners:
+            collisions.append(ConversionResult(job.input_path, job.output_path, ok=False,
+                                               error=f"Output path is also the target of {owners[key].input_path}"))
+        else:
+            owners[key] = job
+            kept.append(job)
+    return kept, collisions
+
+
+_caches: Dict[Tuple[str, int, bool], ConversionCache] = {}
+
+
+def _get_cache(job: ConversionJob) -> Optional[ConversionCache]:
+    """One ConversionCache per process and setting, so its size bookkeeping survives between jobs."""
+    if not job.cache_dir:
+        return None
+    settings = (job.cache_dir, job.cache_max_bytes, job.hardlink)
+    if settings not in _caches:
+        _caches[settings] = ConversionCache(job.cache_dir, job.cache_max_bytes, job.hardlink)
+    return _caches[settings]
+
+
+def run_job(job: ConversionJob) -> ConversionResult:
+    """Converts one file. Never raises, so a single bad input cannot abort the batch."""
+    result = ConversionResult(input_path=job.input_path, output_path=job.output_path, ok=False)
+    started = time.perf_counter()
+    cache = None
+    metrics = ConversionMetrics()
+    try:
+        cache = _get_cache(job)
+        before = cache.stats() if cache else {}
+        os.makedirs(os.path.dirname(os.path.abspath(job.output_path)), exist_ok=True)
+        if job.profile_prefix:
+            os.makedirs(os.path.dirname(os.path.abspath(job.profile_prefix)), exist_ok=True)
+        with profiled(job.profile_prefix) if job.profile_prefix else nullcontext(), \
+                IconConverter(job.input_path, encoder=job.encoder, cache=cache, streaming=job.streaming) as converter:
+            if job.color.strip().lower() != "auto":
+                subject_color = parse_color(job.color)
+                result.subject_color = tuple(subject_color)
+            else:
+                detect_started = time.perf_counter()
+                subject_color = IconConverter.PLACEHOLDER_COLOR  # For modes that never look at it
+                if converter.needs_subject_color(job.mode):
+                    metrics.merge(converter.metrics)
+                    subject_color = converter.find_dominant_color()
+                    if subject_color is None:
+                        raise ValueError("Auto-detection could not find a subject color")
+                    result.subject_color = tuple(subject_color)
+                result.timings["detect"] = time.perf_counter() - detect_started
+                metrics.merge(converter.metrics)
+
+            convert_started = time.perf_counter()
+            converter.convert(job.output_path, subject_color, job.tolerance, sizes=job.sizes, mode=job.mode)
+            result.timings["convert"] = time.perf_counter() - convert_started
+            metrics.merge(converter.metrics)
+            result.bbox = converter.bbox
+            result.mode = converter.subject_mode
+        result.ok = True
+    except Exception as e:
+        result.error = f"{type(e).__name__}: {e}"
+    result.stages = metrics.stages
+    result.counters = metrics.counters
+    if cache is not None:
+        result.cache = {kind: {counter: value - before[kind][counter] for counter, value in counters.items()}
+                        for kind, counters in cache.stats().items()}
+    result.timings["total"] = time.perf_counter() - started
+    return result
+
+
+def setup_logging(log_level: int, log_file: Optional[str] = None):
+    """Logs to stderr and, for headless runs that need a record, appends to log_file."""
+    root = logging.getLogger()
+    if root.handlers:  # Already configured, e.g. inherited by a forked worker.
+        return
+    root.setLevel(logging.INFO if log_file else log_level)
+    formatter = logging.Formatter('[%(levelname)s] %(processName)s: %(message)s')
+    console = logging.StreamHandler()
+    console.setLevel(log_level)
+    console.setFormatter(formatter)
+    root.addHandler(console)
+    if log_file:
+        file_handler = logging.FileHandler(log_file, encoding='utf-8')
+        file_handler.setFormatter(formatter)
+        root.addHandler(file_handler)
+
+
+def run_batch(jobs: List[ConversionJob], workers: int, log_level: int = logging.WARNING,
+              log_file: Optional[str] = None) -> List[ConversionResult]:
+    if workers <= 1 or len(jobs) <= 1:
+        return [run_job(job) for job in jobs]
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=setup_logging,
+                             initargs=(log_level, log_file)) as executor:
+        futures = {executor.submit(run_job, job): job for job in jobs}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                results.append(future.result())
+            except Exception as e:  # e.g. a worker process died
+                results.append(ConversionResult(job.input_path, job.output_path, ok=False,
+                                                error=f"{type(e).__name__}: {e}"))
+    order = {job.input_path: index for index, job in enumerate(jobs)}
+    return sorted(results, key=lambda r: order[r.input_path])
+
+
+def print_stage_timings(results: List[ConversionResult]):
+    """Prints p50/p95/max per converter stage over the files that converted."""
+    runs = [dict(r.stages, total=r.timings["total"]) for r in results if r.ok]
+    if not runs:
+        return
+    print(f"{'stage':<12}{'files':>6}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}", file=sys.stderr)
+    for stage, statistics in aggregate_stages(runs).items():
+        print(f"{stage:<12}{statistics['count']:>6}{statistics['p50'] * 1000:>10.1f}"
+              f"{statistics['p95'] * 1000:>10.1f}{statistics['max'] * 1000:>10.1f}", file=sys.stderr)
+
+
+def add_conversion_arguments(parser: argparse.ArgumentParser):
+    """Options that shape each ConversionJob, shared with Icon_Master_Watch."""
+    parser.add_argument("-o", "--output-dir", help="Write icons here instead of next to each input.")
+    parser.add_argument("-c", "--color", default=DEFAULT_COLOR,
+                        help=f"Subject color as #RRGGBB, or 'auto' to detect it per file (default: {DEFAULT_COLOR}).")
+    parser.add_argument("-t", "--tolerance", type=int, default=DEFAULT_TOLERANCE,
+                        help=f"Color tolerance, 0-255 (default: {DEFAULT_TOLERANCE}).")
+    parser.add_argument("-m", "--mode", choices=IconConverter.SUBJECT_MODES, default="color",
+                        help="How subject pixels are found: near the color, non-transparent, different from "
+                             "the corner background, near any of the main colors, or picked per image (auto).")
+    parser.add_argument("-s", "--sizes", type=parse_sizes,
+                        help="Comma-separated icon sizes such as 16,32,48,256 or 20x20 (default: 16 to 256).")
+    parser.add_argument("--resample", choices=sorted(RESAMPLING_FILTERS), default="lanczos",
+                        help="Filter used for each step of the downscale pyramid (default: lanczos).")
+    parser.add_argument("--png-min-size", type=int, default=256,
+                        help="Store frames at least this large as PNG and smaller ones as BMP (default: 256).")
+    parser.add_argument("--cache-dir", metavar="DIR",
+                        help="Reuse results for unchanged inputs from this cache directory.")
+    parser.add_argument("--cache-size", type=int, default=256, metavar="MIB",
+                        help="Evict least recently used cache entries beyond this size (default: 256 MiB).")
+    parser.add_argument("--hardlink", action="store_true",
+                        help="Hard-link cached icons into place instead of copying them.")
+    parser.add_argument("--streaming", choices=("auto", "on", "off"), default="auto",
+                        help="Scan inputs in strips to bound memory use (default: auto, for images of 64 MP and up).")
+    parser.add_argument("--overrides", metavar="JSON",
+                        help="JSON file with per-file {\"color\": ..., \"tolerance\": ..., \"mode\": ...} settings.")
+    parser.add_argument("-j", "--jobs", type=int, default=available_cpus(),
+                        help="Number of worker processes (default: available cores).")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="Icon_Master_CLI",
+        description="Convert images to multi-size .ico files without the GUI.")
+    parser.add_argument("inputs", nargs="+", help="Image files, directories or glob patterns.")
+    add_conversion_arguments(parser)
+    parser.add_argument("-r", "--recursive", action="store_true", help="Descend into sub-directories and '**' globs.")
+    parser.add_argument("--json", metavar="PATH",
+                        help="Write the per-file results as JSON to PATH ('-' for stdout).")
+    parser.add_argument("--timings", action="store_true",
+                        help="Print per-stage p50/p95 timings across the batch.")
+    parser.add_argument("--profile", metavar="DIR",
+                        help="Write a cProfile and tracemalloc report per input file to DIR.")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Show converter log messages.")
+    parser.add_argument("--log-file", metavar="PATH", help="Append all converter log messages to PATH.")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    log_level = logging.INFO if args.verbose else logging.WARNING
+    setup_logging(log_level, args.log_file)
+
+    inputs = collect_inputs(args.inputs, args.recursive)
+    if not inputs:
+        logging.error("No input images found.")
+        return 2
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+    if args.profile:
+        os.makedirs(args.profile, exist_ok=True)
+
+    # With several worker processes, frames are encoded serially inside each process.
+    encoder = IconEncoder(resample=args.resample, png_min_size=args.png_min_size,
+                          max_workers=1 if args.jobs > 1 and len(inputs) > 1 else None)
+    jobs = build_jobs(inputs, args.color, args.tolerance, args.output_dir, load_overrides(args.overrides),
+                      args.sizes, encoder, args.cache_dir, args.cache_size * 1024 * 1024, args.hardlink,
+                      {"auto": None, "on": True, "off": False}[args.streaming], args.profile, args.mode)
+    jobs, collisions = split_output_collisions(jobs)
+    started = time.perf_counter()
+    results = run_batch(jobs, args.jobs, log_level, args.log_file)
+    elapsed = time.perf_counter() - started
+    order = {path: index for index, path in enumerate(inputs)}
+    results = sorted(results + collisions, key=lambda r: order[r.input_path])
+
+    failed = [r for r in results if not r.ok]
+    for result in results:
+        if result.ok:
+            print(f"OK     {result.input_path} -> {result.output_path} "
+                  f"bbox={result.bbox} ({result.timings['total']:.2f}s)", file=sys.stderr)
+        else:
+            print(f"FAILED {result.input_path}: {result.error}", file=sys.stderr)
+    print(f"{len(results) - len(failed)}/{len(results)} converted in {elapsed:.2f}s "
+          f"using {min(args.jobs, len(jobs))} worker(s).", file=sys.stderr)
+
+    if args.cache_dir:
+        totals = {kind: [sum(r.cache.get(kind, {}).get(counter, 0) for r in results)
+                         for counter in ('hits', 'misses')] for kind in CACHE_KINDS}
+        print("Cache: " + ", ".join(f"{kind} {hits} hit(s)/{misses} miss(es)"
+                                    for kind, (hits, misses) in totals.items()), file=sys.stderr)
+
+    if args.timings:
+        print_stage_timings(results)
+
+    if args.json:
+        report = json.dumps([asdict(r) for r in results], indent=2)
+        if args.json == '-':
+            print(report)
+        else:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                f.write(report)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
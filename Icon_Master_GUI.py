@@ -1,19 +1,24 @@
 # Icon_Master_GUI.py
 
+import time
+_MODULE_STARTED = time.perf_counter()  # Start of the --measure-startup clock, before the heavy imports.
+
+import argparse
 import customtkinter as ctk
 import tkinter as tk
 from tkinter import filedialog, colorchooser
 import os
 import sys
-import subprocess
 import logging
-import requests
-import time
-import psutil
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
 
 # Import the backend class from the separate file
-from Icon_Converter_Algorithm import IconConverter
+from Icon_Converter_Algorithm import IconConverter, ConversionCancelled, SubjectPreview, IMAGE_EXTENSIONS
+
+_IMPORTS_DONE = time.perf_counter()
 
 APP_VERSION = "1.2.0"
 # This now points to the JSON file that contains links to BOTH the app and the updater
@@ -21,67 +26,163 @@ VERSION_INFO_URL = "https://raw.githubusercontent.com/JailbreakHubOfficial/PNGto
 
 
 class TextboxHandler(logging.Handler):
-    def __init__(self, textbox):
+    """
+    Thread-safe log sink for the status textbox.
+
+    emit() only queues the formatted line, so it is safe to call from worker threads. The Tk main
+    loop drains the queue once per frame with a single insert and trims the widget to max_lines.
+    Records can also be appended to log_file, which keeps a full log when the widget is trimmed.
+    """
+    FLUSH_INTERVAL_MS = 16  # ~60 fps
+
+    def __init__(self, textbox, max_lines=2000, log_file=None):
         super().__init__()
         self.textbox = textbox
+        self.max_lines = max_lines
+        self._pending = queue.SimpleQueue()
+        self._file = open(log_file, 'a', encoding='utf-8') if log_file else None
+        self._flush_job = self.textbox.after(self.FLUSH_INTERVAL_MS, self._flush)
 
     def emit(self, record):
-        msg = self.format(record)
-        self.textbox.configure(state="normal")
-        self.textbox.insert("end", msg + "\n")
-        self.textbox.configure(state="disabled")
-        self.textbox.see("end")
-        self.textbox.update_idletasks()
+        try:
+            msg = self.format(record)
+            self._pending.put(msg)
+            if self._file is not None:
+                self._file.write(msg + "\n")
+                self._file.flush()
+        except Exception:
+            self.handleError(record)
+
+    def _flush(self):
+        lines = []
+        try:
+            while True:
+                lines.append(self._pending.get_nowait())
+        except queue.Empty:
+            pass
+
+        if lines:
+            self.textbox.configure(state="normal")
+            self.textbox.insert("end", "\n".join(lines) + "\n")
+            # The widget always ends with an empty line after the last newline.
+            excess = int(self.textbox.index("end-1c").split(".")[0]) - 1 - self.max_lines
+            if excess > 0:
+                self.textbox.delete("1.0", f"{excess + 1}.0")
+            self.textbox.configure(state="disabled")
+            self.textbox.see("end")
+        self._flush_job = self.textbox.after(self.FLUSH_INTERVAL_MS, self._flush)
+
+    def close(self):
+        if self._flush_job is not None:
+            self.textbox.after_cancel(self._flush_job)
+            self._flush_job = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        super().close()
 
 
 class IconMasterApp(ctk.CTk):
-    def __init__(self):
+    POLL_INTERVAL_MS = 16  # ~60 fps
+    PREVIEW_SIZE = 200
+    UPDATER_NAME = "autoupdater.exe"
+
+    def __init__(self, log_file=None, measure_startup=False):
         super().__init__()
-        self._cleanup_updater()  # <-- ADDED THIS LINE
+        self.log_file = log_file
+        self.measure_startup = measure_startup
+        self._init_started = time.perf_counter()
 
         self.title(f"Icon Master GUI")
-        self.geometry("800x600")
+        self.geometry("1000x600")
         ctk.set_appearance_mode("Dark")
         ctk.set_default_color_theme("blue")
         self.grid_columnconfigure(0, weight=1)
         self.grid_rowconfigure(2, weight=1)
-        self.folder_icon = ctk.CTkImage(Image.open(self._resource_path("assets/folder_icon.png")))
-        self.save_icon = ctk.CTkImage(Image.open(self._resource_path("assets/save_icon.png")))
-        self.palette_icon = ctk.CTkImage(Image.open(self._resource_path("assets/palette_icon.png")))
-        self.magic_wand_icon = ctk.CTkImage(Image.open(self._resource_path("assets/magic_wand_icon.png")))
-        self.update_icon = ctk.CTkImage(Image.open(self._resource_path("assets/update_icon.png")))
+        # Button icons are decoded after the first frame; see _load_icons().
+        self._icons = {}
+        self._icon_buttons = []
         self.input_file_path = tk.StringVar()
         self.output_file_path = tk.StringVar()
         self.subject_color_hex = tk.StringVar(value="#42D6FF")
         self.tolerance_value = tk.IntVar(value=120)
+        self.subject_mode = tk.StringVar(value="Color")
+        # Conversion and auto-detection run on this worker; results come back through a queue.
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="IconMasterWorker")
+        self._task_queue = queue.Queue()
+        self._cancel_event = None
+        # Preview proxies are built on their own worker, so a new file's preview never waits behind a conversion.
+        self._preview_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="IconMasterPreview")
+        self._preview = None
+        # One converter per selected file, so preview, detection and conversion share a single decode.
+        # Only worker threads use it, one at a time under _converter_lock.
+        self._converter = None
+        self._converter_lock = None
         self._create_widgets()
         self._setup_logging()
+        self.protocol("WM_DELETE_WINDOW", self._on_close)
+        self._poll_job = self.after(self.POLL_INTERVAL_MS, self._poll_task_queue)
+        # Idle callbacks run after the pending redraws, i.e. once the first frame is on screen.
+        self.after_idle(self._on_first_frame)
+
+    def _on_first_frame(self):
+        self.update_idletasks()
+        first_frame = time.perf_counter()
+        self._load_icons()
+        # Updater cleanup may scan every process on the system; keep it off the UI thread.
+        threading.Thread(target=self._cleanup_updater, name="IconMasterUpdaterCleanup", daemon=True).start()
+
+        if self.measure_startup:
+            report = (f"Startup: imports {(_IMPORTS_DONE - _MODULE_STARTED) * 1000:.1f} ms, "
+                      f"window setup {(first_frame - self._init_started) * 1000:.1f} ms, "
+                      f"first frame {(first_frame - _MODULE_STARTED) * 1000:.1f} ms after launch")
+            logging.info(report)
+            print(report, file=sys.stderr)
+            self.after(0, self._on_close)
+
+    def _icon(self, name):
+        """CTkImage for assets/<name>.png, decoded on first use."""
+        if name not in self._icons:
+            with Image.open(self._resource_path(f"assets/{name}.png")) as img:
+                self._icons[name] = ctk.CTkImage(img.copy())
+        return self._icons[name]
+
+    def _load_icons(self):
+        for button, name in self._icon_buttons:
+            button.configure(image=self._icon(name))
+
+    def _with_icon(self, button, name):
+        """Registers button to receive the named icon once the first frame is drawn."""
+        self._icon_buttons.append((button, name))
+        return button
+
+    def _app_dir(self):
+        if getattr(sys, 'frozen', False):
+            return os.path.dirname(sys.executable)
+        return os.path.dirname(os.path.abspath(__file__))
 
     def _cleanup_updater(self):
-        UPDATER_NAME = "autoupdater.exe"
+        """Stops and deletes an autoupdater left over from the last update. Runs on a background thread."""
+        updater_path = os.path.join(self._app_dir(), self.UPDATER_NAME)
+        if not os.path.exists(updater_path):
+            return  # Nothing was updated, so there is no updater process to look for.
         try:
+            import psutil
+
             # 1. Find and terminate the updater process
             for proc in psutil.process_iter(['name']):
-                if proc.info['name'] == UPDATER_NAME:
+                if proc.info['name'] == self.UPDATER_NAME:
                     proc.kill()  # Forcefully terminate the process
                     proc.wait(timeout=3)  # Wait for termination to complete
 
             # 2. Delete the updater file (with the original retry logic)
-            if getattr(sys, 'frozen', False):
-                current_dir = os.path.dirname(sys.executable)
-            else:
-                current_dir = os.path.dirname(os.path.abspath(__file__))
-
-            updater_path = os.path.join(current_dir, UPDATER_NAME)
-
-            if os.path.exists(updater_path):
-                for _ in range(5):
-                    try:
-                        os.remove(updater_path)
-                        break
-                    except PermissionError:
-                        time.sleep(0.2)  # Wait a bit longer
-        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess, Exception):
+            for _ in range(5):
+                try:
+                    os.remove(updater_path)
+                    break
+                except PermissionError:
+                    time.sleep(0.2)  # Wait a bit longer
+        except Exception:
             # Fail silently. Cleanup is a best-effort, not critical.
             pass
 
@@ -95,6 +196,10 @@ class IconMasterApp(ctk.CTk):
     def _run_updater(self):
         logging.info("Checking for updates...")
         try:
+            # Only needed here, and requests alone adds noticeably to startup time.
+            import requests
+            import subprocess
+
             cert_path = self._resource_path('cacert.pem')
             os.environ['REQUESTS_CA_BUNDLE'] = cert_path
 
@@ -108,12 +213,8 @@ class IconMasterApp(ctk.CTk):
             updater_response.raise_for_status()
 
             # FIXED: Save as autoupdater.exe in the main app directory
-            if getattr(sys, 'frozen', False):
-                executable_dir = os.path.dirname(sys.executable)
-            else:
-                executable_dir = os.path.dirname(os.path.abspath(__file__))
-
-            updater_path = os.path.join(executable_dir, 'autoupdater.exe')
+            executable_dir = self._app_dir()
+            updater_path = os.path.join(executable_dir, self.UPDATER_NAME)
             with open(updater_path, 'wb') as f:
                 f.write(updater_response.content)
             logging.info("Updater executable downloaded successfully.")
@@ -138,8 +239,9 @@ class IconMasterApp(ctk.CTk):
         title_label.pack(side="left", padx=10)
 
         # Create and add the update button to the right of the title bar
-        update_button = ctk.CTkButton(title_frame, text="", image=self.update_icon, command=self._run_updater,
-                                      width=32, height=32, fg_color="transparent", hover_color="#444444")
+        update_button = self._with_icon(ctk.CTkButton(title_frame, text="", command=self._run_updater, width=32,
+                                                      height=32, fg_color="transparent", hover_color="#444444"),
+                                        "update_icon")
         update_button.pack(side="right", padx=10)
 
         # --- 2. MODIFIED: All main frames are shifted down by one row ---
@@ -147,6 +249,18 @@ class IconMasterApp(ctk.CTk):
         main_frame.grid(row=1, column=0, padx=20, pady=10, sticky="ew")  # Changed row to 1
         main_frame.grid_columnconfigure((0, 1), weight=1)
 
+        # Live crop preview, redrawn on every tolerance or subject mode change.
+        preview_frame = ctk.CTkFrame(main_frame)
+        preview_frame.grid(row=0, column=2, padx=(20, 0), pady=10, sticky="nsew")
+        ctk.CTkLabel(preview_frame, text="Preview", font=ctk.CTkFont(size=16, weight="bold")).pack(padx=15,
+                                                                                                 pady=(15, 5),
+                                                                                                 anchor="w")
+        self.preview_label = ctk.CTkLabel(preview_frame, text="No image", width=self.PREVIEW_SIZE,
+                                          height=self.PREVIEW_SIZE)
+        self.preview_label.pack(padx=15)
+        self.preview_info_label = ctk.CTkLabel(preview_frame, text="")
+        self.preview_info_label.pack(padx=15, pady=(0, 10))
+
         # File Setup Frame (no changes inside this frame)
         file_frame = ctk.CTkFrame(main_frame)
         file_frame.grid(row=0, column=0, padx=(0, 10), pady=10, sticky="nsew")
@@ -158,17 +272,13 @@ class IconMasterApp(ctk.CTk):
         ctk.CTkLabel(file_frame, text="Input Image").grid(row=1, column=0, columnspan=2, padx=15, pady=(5, 0), sticky="w")
         ctk.CTkEntry(file_frame, textvariable=self.input_file_path, state="readonly").grid(row=2, column=0, padx=15, pady=5,
                                                                                            sticky="ew")
-        ctk.CTkButton(file_frame, text="Browse", image=self.folder_icon, command=self._select_input_file).grid(row=2,
-                                                                                                               column=1,
-                                                                                                               padx=(0, 15),
-                                                                                                               pady=5)
+        self._with_icon(ctk.CTkButton(file_frame, text="Browse", command=self._select_input_file),
+                        "folder_icon").grid(row=2, column=1, padx=(0, 15), pady=5)
         ctk.CTkLabel(file_frame, text="Output (.ico)").grid(row=3, column=0, columnspan=2, padx=15, pady=(5, 0), sticky="w")
         ctk.CTkEntry(file_frame, textvariable=self.output_file_path).grid(row=4, column=0, padx=15, pady=(5, 20),
                                                                           sticky="ew")
-        ctk.CTkButton(file_frame, text="Save As", image=self.save_icon, command=self._select_output_file).grid(row=4,
-                                                                                                               column=1,
-                                                                                                               padx=(0, 15),
-                                                                                                               pady=(5, 20))
+        self._with_icon(ctk.CTkButton(file_frame, text="Save As", command=self._select_output_file),
+                        "save_icon").grid(row=4, column=1, padx=(0, 15), pady=(5, 20))
 
         # Cropping Controls Frame (no changes inside this frame)
         controls_frame = ctk.CTkFrame(main_frame)
@@ -187,47 +297,64 @@ class IconMasterApp(ctk.CTk):
         self.color_preview_label.grid(row=2, column=0, padx=15, pady=5, sticky="w")
         color_buttons_frame = ctk.CTkFrame(controls_frame, fg_color="transparent")
         color_buttons_frame.grid(row=2, column=1, columnspan=2, padx=10, pady=5, sticky="w")
-        ctk.CTkButton(color_buttons_frame, text="Pick", image=self.palette_icon, command=self._pick_subject_color,
-                      width=100).pack(side="left", padx=5)
-        ctk.CTkButton(color_buttons_frame, text="Auto", image=self.magic_wand_icon, command=self._auto_detect_color,
-                      width=100).pack(side="left", padx=5)
+        self._with_icon(ctk.CTkButton(color_buttons_frame, text="Pick", command=self._pick_subject_color, width=100),
+                        "palette_icon").pack(side="left", padx=5)
+        self.auto_button = self._with_icon(ctk.CTkButton(color_buttons_frame, text="Auto",
+                                                         command=self._auto_detect_color, width=100),
+                                           "magic_wand_icon")
+        self.auto_button.pack(side="left", padx=5)
         ctk.CTkLabel(controls_frame, text="Tolerance").grid(row=3, column=0, columnspan=3, padx=15, pady=(10, 0),
                                                             sticky="w")
         ctk.CTkSlider(controls_frame, from_=0, to=255, variable=self.tolerance_value,
-                      command=self._update_tolerance_label).grid(row=4, column=0, columnspan=2, padx=15, pady=(5, 20),
+                      command=self._update_tolerance_label).grid(row=4, column=0, columnspan=2, padx=15, pady=5,
                                                                  sticky="ew")
         self.tolerance_label = ctk.CTkLabel(controls_frame, text=f"{self.tolerance_value.get()}", width=40)
-        self.tolerance_label.grid(row=4, column=2, padx=(0, 15), pady=(5, 20))
+        self.tolerance_label.grid(row=4, column=2, padx=(0, 15), pady=5)
+        ctk.CTkLabel(controls_frame, text="Subject Mode").grid(row=5, column=0, padx=15, pady=(5, 20), sticky="w")
+        ctk.CTkOptionMenu(controls_frame, variable=self.subject_mode,
+                          values=[mode.capitalize() for mode in IconConverter.SUBJECT_MODES],
+                          command=self._update_subject_mode, width=130).grid(row=5, column=1, columnspan=2,
+                                                                             padx=(0, 15), pady=(5, 20), sticky="e")
 
         # --- 3. MODIFIED: Other widgets are shifted down ---
-        ctk.CTkButton(self, text="Create Icon", command=self._run_conversion, height=50,
-                      font=ctk.CTkFont(size=18, weight="bold")).grid(row=2, column=0, padx=20, pady=10,
-                                                                     sticky="ew")  # Changed row to 2
+        action_frame = ctk.CTkFrame(self, fg_color="transparent")
+        action_frame.grid(row=2, column=0, padx=20, pady=10, sticky="ew")  # Changed row to 2
+        action_frame.grid_columnconfigure(0, weight=1)
+        self.create_button = ctk.CTkButton(action_frame, text="Create Icon", command=self._run_conversion, height=50,
+                                           font=ctk.CTkFont(size=18, weight="bold"))
+        self.create_button.grid(row=0, column=0, columnspan=2, sticky="ew")
+        self.progress_bar = ctk.CTkProgressBar(action_frame)
+        self.progress_bar.set(0)
+        self.progress_bar.grid(row=1, column=0, padx=(0, 10), pady=(10, 0), sticky="ew")
+        self.cancel_button = ctk.CTkButton(action_frame, text="Cancel", command=self._cancel_task, width=100,
+                                           state="disabled")
+        self.cancel_button.grid(row=1, column=1, pady=(10, 0))
 
         self.status_textbox = ctk.CTkTextbox(self, state="disabled", wrap="word",
                                              font=ctk.CTkFont(family="monospace", size=13))
         self.status_textbox.grid(row=3, column=0, padx=20, pady=(0, 20), sticky="nsew")  # Changed row to 3
 
-        update_button = ctk.CTkButton(self, text="", image=self.update_icon, command=self._run_updater, width=32,
-                                      height=32, fg_color="transparent", hover_color="#333333")
-
     def _setup_logging(self):
         logger = logging.getLogger()
         logger.setLevel(logging.INFO)
         logger.handlers = []
-        handler = TextboxHandler(self.status_textbox)
+        handler = TextboxHandler(self.status_textbox, log_file=self.log_file)
         formatter = logging.Formatter('[%(levelname)s] %(message)s')
         handler.setFormatter(formatter)
         logger.addHandler(handler)
+        self._log_handler = handler
 
     def _select_input_file(self):
+        patterns = " ".join("*" + ext for ext in IMAGE_EXTENSIONS)
         file_path = filedialog.askopenfilename(title="Select an Image",
-                                               filetypes=(("Image Files", "*.png *.jpg *.jpeg"), ("All files", "*.*")))
+                                               filetypes=(("Image Files", patterns), ("All files", "*.*")))
         if file_path:
             self.input_file_path.set(file_path)
             base, _ = os.path.splitext(file_path)
             self.output_file_path.set(base + ".ico")
             logging.info(f"Selected input: {os.path.basename(file_path)}")
+            self._open_converter(file_path)
+            self._load_preview(file_path)
 
     def _select_output_file(self):
         file_path = filedialog.asksaveasfilename(title="Save Icon As", defaultextension=".ico",
@@ -240,46 +367,214 @@ class IconMasterApp(ctk.CTk):
             self.subject_color_hex.set(color_code[1])
             self.color_preview_label.configure(fg_color=color_code[1])
             logging.info(f"Set subject color to: {color_code[1]}")
+            self._draw_preview()
+
+    def _open_converter(self, input_p):
+        """Swaps in a converter for the newly selected file; the old one is released once no worker uses it."""
+        if self._converter is not None:
+            self._executor.submit(self._release_worker, self._converter, self._converter_lock)
+        self._converter, self._converter_lock = None, None
+        try:
+            self._converter = IconConverter(input_p)
+        except Exception as e:
+            logging.error(f"Could not open {os.path.basename(input_p)}: {e}")
+            return
+        self._converter_lock = threading.Lock()
 
     def _auto_detect_color(self):
-        input_p = self.input_file_path.get()
-        if not input_p:
+        if self._converter is None:
             logging.error("Please select an input image first.")
             return
-        try:
-            logging.info("--- Auto-Detecting Color ---")
-            converter = IconConverter(input_p)
-            dominant_rgb = converter.find_dominant_color()
-            if dominant_rgb:
-                hex_color = f"#{dominant_rgb[0]:02x}{dominant_rgb[1]:02x}{dominant_rgb[2]:02x}"
-                self.subject_color_hex.set(hex_color)
-                self.color_preview_label.configure(fg_color=hex_color)
-        except Exception as e:
-            logging.error(f"An error occurred during auto-detection: {e}")
+        logging.info("--- Auto-Detecting Color ---")
+        self._start_task("detect", self._detect_worker, self._converter, self._converter_lock)
 
     def _update_tolerance_label(self, value):
         self.tolerance_label.configure(text=f"{int(value)}")
+        self._draw_preview()
+
+    def _update_subject_mode(self, value):
+        logging.info(f"Subject mode: {value}")
+        self._draw_preview()
+
+    def _subject_rgb(self):
+        color_hex = self.subject_color_hex.get().lstrip('#')
+        return tuple(int(color_hex[i:i + 2], 16) for i in (0, 2, 4))
+
+    def _show_preview_text(self, text):
+        # CTkLabel ignores image=None, so the inner Tk label has to drop the previous file's image itself.
+        self.preview_label.configure(image=None, text=text)
+        self.preview_label._label.configure(image="")
+
+    def _load_preview(self, input_p):
+        self._preview = None
+        self._show_preview_text("Loading...")
+        self.preview_info_label.configure(text="")
+        if self._converter is None:
+            self._show_preview_text("No preview")
+            return
+        future = self._preview_executor.submit(self._preview_worker, self._converter, self._converter_lock)
+        future.add_done_callback(lambda f: self._task_queue.put(("preview", input_p, f)))
+
+    def _draw_preview(self):
+        """Thresholds the cached distance map; cheap enough for every slider tick."""
+        if self._preview is None:
+            return
+        try:
+            self._preview.set_subject_color(self._subject_rgb(), self.subject_mode.get().lower())
+        except ValueError:
+            return
+        tolerance = self.tolerance_value.get()
+        image = self._preview.render(tolerance)
+        self.preview_label.configure(image=ctk.CTkImage(image, size=image.size), text="")
+        bbox = self._preview.source_bbox(tolerance)
+        if bbox:
+            self.preview_info_label.configure(text=f"Crop ≈ {bbox[2] - bbox[0]}×{bbox[3] - bbox[1]} px")
+        else:
+            self.preview_info_label.configure(text="No matching pixels")
 
     def _run_conversion(self):
-        input_p, output_p = self.input_file_path.get(), self.output_file_path.get()
-        if not input_p or not output_p:
+        output_p = self.output_file_path.get()
+        if self._converter is None or not output_p:
             logging.error("Please select both input and output files.")
             return
         try:
-            color_hex = self.subject_color_hex.get().lstrip('#')
-            subject_rgb = tuple(int(color_hex[i:i + 2], 16) for i in (0, 2, 4))
-            logging.info("--- Starting Conversion ---")
-            converter = IconConverter(input_p)
-            converter.convert(
+            subject_rgb = self._subject_rgb()
+        except ValueError as e:
+            logging.error(f"Invalid subject color: {e}")
+            return
+        logging.info("--- Starting Conversion ---")
+        self._start_task("convert", self._convert_worker, self._converter, self._converter_lock, output_p,
+                         subject_rgb, self.tolerance_value.get(), self.subject_mode.get().lower())
+
+    # --- Background work ---
+    # Worker methods run on the executor thread and must not touch any widget. They talk to the
+    # main loop only through self._task_queue, which _poll_task_queue drains every frame.
+
+    def _start_task(self, kind, worker, *args):
+        if self._cancel_event is not None:
+            logging.warning("Please wait for the current operation to finish.")
+            return
+        self._cancel_event = threading.Event()
+        self._set_busy(True, determinate=(kind == "convert"))
+        future = self._executor.submit(worker, *args, self._cancel_event)
+        future.add_done_callback(lambda f: self._task_queue.put(("done", kind, f)))
+
+    def _preview_worker(self, converter, lock):
+        preview_size = (self.PREVIEW_SIZE, self.PREVIEW_SIZE)
+        with lock:
+            if converter._use_streaming():
+                # Poster-size input: read a reduced copy in strips instead of holding the full RGBA.
+                source, source_size = converter.stream.reduced(preview_size), converter.stream.size
+            else:
+                source, source_size = converter.rgba, None
+            return SubjectPreview(source, preview_size, palette=converter.find_subject_palette(),
+                                  source_size=source_size)
+
+    def _detect_worker(self, converter, lock, cancel_event):
+        with lock:
+            return converter.find_dominant_color(cancel_event=cancel_event)
+
+    def _convert_worker(self, converter, lock, output_p, subject_rgb, tolerance, mode, cancel_event):
+        with lock:
+            return converter.convert(
                 output_path=output_p,
                 subject_color=subject_rgb,
-                tolerance=self.tolerance_value.get()
+                tolerance=tolerance,
+                mode=mode,
+                progress_callback=self._report_progress,
+                cancel_event=cancel_event
             )
+
+    @staticmethod
+    def _release_worker(converter, lock):
+        with lock:
+            converter.release()
+
+    def _report_progress(self, done, total):
+        self._task_queue.put(("progress", done / total if total else 1.0, None))
+
+    def _poll_task_queue(self):
+        try:
+            while True:
+                message, value, future = self._task_queue.get_nowait()
+                if message == "progress":
+                    self.progress_bar.set(value)
+                elif message == "preview":
+                    self._finish_preview(value, future)
+                else:
+                    self._finish_task(value, future)
+        except queue.Empty:
+            pass
+        self._poll_job = self.after(self.POLL_INTERVAL_MS, self._poll_task_queue)
+
+    def _finish_preview(self, input_p, future):
+        if input_p != self.input_file_path.get():
+            return  # A newer file was selected meanwhile.
+        try:
+            self._preview = future.result()
         except Exception as e:
-            logging.error(f"An unexpected error occurred: {e}")
+            self._show_preview_text("No preview")
+            logging.error(f"Could not load preview: {e}")
+            return
+        self._draw_preview()
+
+    def _finish_task(self, kind, future):
+        self._cancel_event = None
+        self._set_busy(False)
+        try:
+            result = future.result()
+        except ConversionCancelled:
+            logging.info("Operation cancelled.")
+            return
+        except Exception as e:
+            if kind == "detect":
+                logging.error(f"An error occurred during auto-detection: {e}")
+            else:
+                logging.error(f"An unexpected error occurred: {e}")
+            return
+
+        if kind == "detect" and result:
+            hex_color = f"#{result[0]:02x}{result[1]:02x}{result[2]:02x}"
+            self.subject_color_hex.set(hex_color)
+            self.color_preview_label.configure(fg_color=hex_color)
+            self._draw_preview()
+        elif kind == "convert":
+            self.progress_bar.set(1)
+
+    def _set_busy(self, busy, determinate=True):
+        state = "disabled" if busy else "normal"
+        self.create_button.configure(state=state)
+        self.auto_button.configure(state=state)
+        self.cancel_button.configure(state="normal" if busy else "disabled")
+        if busy and not determinate:
+            self.progress_bar.configure(mode="indeterminate")
+            self.progress_bar.start()
+        else:
+            self.progress_bar.stop()
+            self.progress_bar.configure(mode="determinate")
+            self.progress_bar.set(0)
+
+    def _cancel_task(self):
+        if self._cancel_event is not None:
+            logging.info("Cancelling...")
+            self._cancel_event.set()
+
+    def _on_close(self):
+        self._cancel_task()
+        self.after_cancel(self._poll_job)
+        self._executor.shutdown(wait=False)
+        self._preview_executor.shutdown(wait=False)
+        logging.getLogger().removeHandler(self._log_handler)
+        self._log_handler.close()
+        self.destroy()
 
 
 if __name__ == "__main__":
-    app = IconMasterApp()
+    parser = argparse.ArgumentParser(description="Icon Master GUI")
+    parser.add_argument("--log-file", help="Also append every log message to this file.")
+    parser.add_argument("--measure-startup", action="store_true",
+                        help="Report import and first-frame latency, then exit.")
+    args = parser.parse_args()
+    app = IconMasterApp(log_file=args.log_file, measure_startup=args.measure_startup)
     app.mainloop()
 
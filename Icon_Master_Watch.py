@@ -0,0 +1,487 @@
+# Icon_Master_Watch.py
+
+import argparse
+import ctypes
+import ctypes.util
+import json
+import logging
+import os
+import select
+import signal
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from Icon_Converter_Algorithm import CONVERTER_VERSION
+from Icon_Converter_Cache import cache_key, file_digest
+from Icon_Converter_Encoder import IconEncoder
+from Icon_Master_CLI import (ConversionJob, ConversionResult, IMAGE_EXTENSIONS, add_conversion_arguments,
+                             build_jobs, collect_inputs, load_overrides, output_key, run_job, setup_logging)
+
+STATE_FILE_NAME = '.iconmaster-watch.json'
+STATE_VERSION = 1
+
+# (st_mtime_ns, st_size): a file whose signature matches its state entry is not read again.
+Signature = Tuple[int, int]
+
+
+def _signature(path: str) -> Optional[Signature]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+class PollingWatcher:
+    """Reports no events; the daemon's periodic rescans find every change."""
+
+    def __init__(self, wake: socket.socket):
+        self._wake = wake
+
+    def wait(self, timeout: float) -> Optional[Set[str]]:
+        # A socket rather than time.sleep(), so WatchDaemon.stop() can cut the wait short.
+        select.select([self._wake], [], [], max(timeout, 0.0))
+        return set()
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """
+    Linux inotify through ctypes, so no extra package is needed.
+
+    wait() returns the paths touched since the last call, or None when the caller should rescan
+    everything: after a kernel queue overflow or when a watched tree gains a directory. inotify only
+    sees changes made through this machine's kernel; files written to a network share by another
+    host still need the daemon's periodic rescan.
+    """
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ISDIR = 0x40000000
+    WATCH_MASK = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, name length
+
+    def __init__(self, roots: List[str], wake: socket.socket, recursive: bool = False):
+        self._wake = wake
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._libc.inotify_init1.argtypes = [ctypes.c_int]
+        self._libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.recursive = recursive
+        self._directories: Dict[int, str] = {}
+        try:
+            for root in roots:
+                self._add_tree(root)
+        except OSError:
+            self.close()
+            raise
+
+    def _add_tree(self, root: str):
+        walker = os.walk(root) if self.recursive else [(root, [], [])]
+        for directory, _, _ in walker:
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), self.WATCH_MASK)
+            if wd < 0:
+                error = ctypes.get_errno()
+                raise OSError(error, f"Cannot watch {directory}: {os.strerror(error)}")
+            self._directories[wd] = directory
+
+    def wait(self, timeout: float) -> Optional[Set[str]]:
+        readable, _, _ = select.select([self._fd, self._wake], [], [], max(timeout, 0.0))
+        if self._fd not in readable:
+            return set()
+        changed: Set[str] = set()
+        rescan = False
+        while True:
+            try:
+                buffer = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(buffer):
+                wd, mask, _, length = self.EVENT_HEADER.unpack_from(buffer, offset)
+                name = buffer[offset + self.EVENT_HEADER.size:offset + self.EVENT_HEADER.size + length].rstrip(b'\0')
+                offset += self.EVENT_HEADER.size + length
+                if mask & self.IN_Q_OVERFLOW:
+                    rescan = True
+                elif mask & self.IN_IGNORED:
+                    self._directories.pop(wd, None)
+                elif wd in self._directories and name:
+                    path = os.path.join(self._directories[wd], os.fsdecode(name))
+                    if mask & self.IN_ISDIR:
+                        if self.recursive and mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                            try:
+                                self._add_tree(path)
+                            except OSError as e:
+                                # Out of watches (fs.inotify.max_user_watches), or the folder is already
+                                # gone again. Its files are still found by the rescans.
+                                logging.warning(f"⚠️ {e}")
+                            rescan = True  # Files may have landed before the watch existed.
+                    else:
+                        changed.add(path)
+        return None if rescan else changed
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+def _init_worker(log_level: int, log_file: Optional[str]):
+    # Ctrl+C goes to the whole process group; let the daemon finish in-flight files and save its state.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    setup_logging(log_level, log_file)
+
+
+class WatchDaemon:
+    """
+    Keeps the .ico files for one or more folders up to date.
+
+    A file is converted when it is new, or when its size or mtime changed and its SHA-256 differs from
+    the last conversion (a touched but identical file is not reconverted). The state index is saved
+    to state_path after every batch of results, so a restarted daemon only converts what changed
+    while it was down. Settings changes (color, sizes, output folder, ...) also count as changes.
+
+    Two sources with the same output path (icon.png and icon.jpg) would overwrite each other's icon,
+    so the first one converted owns the output and the other fails until the owner is removed.
+
+    A changed file is converted only once its size and mtime have been stable for settle seconds, to
+    skip half-copied files. At most max_in_flight files are handed to the worker processes at once;
+    the rest stay queued in the daemon, so a large drop does not pile up in the pool.
+    """
+
+    def __init__(self, roots: List[str], make_job: Callable[[str], ConversionJob], state_path: str,
+                 workers: int = 1, recursive: bool = False, settle: float = 2.0, rescan_interval: float = 300.0,
+                 max_in_flight: Optional[int] = None, use_inotify: Optional[bool] = None,
+                 log_level: int = logging.WARNING, log_file: Optional[str] = None):
+        self.roots = [os.path.abspath(root) for root in roots]
+        self.make_job = make_job
+        self.state_path = state_path
+        self.workers = max(1, workers)
+        self.recursive = recursive
+        self.settle = settle
+        self.rescan_interval = rescan_interval
+        self.max_in_flight = max_in_flight or 2 * self.workers
+        self.use_inotify = use_inotify
+        self.log_level = log_level
+        self.log_file = log_file
+        self.state: Dict[str, dict] = self._load_state()
+        self._dirty = False
+        # path -> (signature when first seen unchanged, monotonic time it was first seen)
+        self._pending: Dict[str, Tuple[Signature, float]] = {}
+        self._in_flight: Dict[Future, Tuple[str, Signature, str, str]] = {}
+        # output_key(output path) -> the source that converts to it.
+        self._owners: Dict[str, str] = {}
+        for path, entry in self.state.items():
+            if not entry.get('collides_with'):
+                self._owners.setdefault(output_key(entry['output']), path)
+        self._stop = threading.Event()
+        # stop() writes to _wake_writer so that a watcher blocked in select() returns at once.
+        self._wake_reader, self._wake_writer = socket.socketpair()
+        self._wake_writer.setblocking(False)
+
+    # --- State index ---
+
+    def _load_state(self) -> Dict[str, dict]:
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logging.warning(f"⚠️ Ignoring unreadable watch state {self.state_path}: {e}")
+            return {}
+        if data.get('version') != STATE_VERSION:
+            logging.warning(f"⚠️ Ignoring watch state {self.state_path} from another version.")
+            return {}
+        return data.get('files', {})
+
+    def save_state(self):
+        if not self._dirty:
+            return
+        data = json.dumps({'version': STATE_VERSION, 'files': self.state}, indent=1).encode('utf-8')
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.state_path)), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, self.state_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        self._dirty = False
+
+    @staticmethod
+    def settings_key(job: ConversionJob) -> str:
+        """Everything besides the input bytes that changes the output."""
+        return cache_key(CONVERTER_VERSION, job.output_path, job.color, job.tolerance, job.mode, job.sizes,
+                         job.encoder.settings())
+
+    # --- Change detection ---
+
+    def _is_image(self, path: str) -> bool:
+        if not path.lower().endswith(IMAGE_EXTENSIONS):
+            return False
+        if self.recursive:
+            return any(path.startswith(os.path.join(root, '')) for root in self.roots)
+        return os.path.dirname(path) in self.roots
+
+    def observe(self, path: str):
+        """Queues path for conversion if it differs from its state entry."""
+        path = os.path.abspath(path)
+        if not self._is_image(path) or path in {p for p, _, _, _ in self._in_flight.values()}:
+            return
+        signature = _signature(path)
+        if signature is None:
+            self._pending.pop(path, None)
+            if path in self.state:
+                self._release_output(path)
+                del self.state[path]
+                self._dirty = True
+                logging.info(f"Source removed, forgetting it: {path}")
+            return
+        entry = self.state.get(path)
+        if entry and (entry['mtime_ns'], entry['size']) == signature \
+                and entry['settings'] == self.settings_key(self.make_job(path)):
+            self._pending.pop(path, None)
+            return
+        if path not in self._pending or self._pending[path][0] != signature:
+            self._pending[path] = (signature, time.monotonic())
+
+    def scan(self):
+        """Full rescan: picks up anything inotify missed and forgets deleted sources."""
+        found = set(collect_inputs(self.roots, self.recursive))
+        for path in sorted(found | set(self.state) | set(self._pending)):
+            if path in found or self._is_image(path):
+                self.observe(path)
+
+    def _settled(self, path: str, now: float) -> bool:
+        signature, first_seen = self._pending[path]
+        current = _signature(path)
+        if current != signature:
+            self.observe(path)  # Still being written, or gone.
+            return False
+        # Files last written long ago need not wait, e.g. everything already there on the first scan.
+        return now - first_seen >= self.settle or time.time() - signature[0] / 1e9 >= self.settle
+
+    # --- Conversion ---
+
+    def _release_output(self, path: str):
+        """Gives up path's claim on its output and requeues the sources that collided with it."""
+        entry = self.state.get(path)
+        if entry is None or self._owners.get(output_key(entry['output'])) != path:
+            return
+        del self._owners[output_key(entry['output'])]
+        for other, other_entry in list(self.state.items()):
+            if other_entry.get('collides_with') == path:
+                del self.state[other]
+                self._dirty = True
+                self.observe(other)
+
+    def _record(self, path: str, signature: Signature, digest: str, settings: str, result: ConversionResult,
+                collides_with: Optional[str] = None):
+        # Failures are recorded too, so a broken file is retried only once it changes.
+        self.state[path] = {'mtime_ns': signature[0], 'size': signature[1], 'digest': digest,
+                            'settings': settings, 'output': result.output_path, 'error': result.error,
+                            'collides_with': collides_with}
+        self._dirty = True
+        if result.ok:
+            print(f"OK     {result.input_path} -> {result.output_path} "
+                  f"bbox={result.bbox} ({result.timings['total']:.2f}s)", file=sys.stderr)
+        else:
+            print(f"FAILED {result.input_path}: {result.error}", file=sys.stderr)
+
+    def _dispatch(self, executor: ProcessPoolExecutor) -> List[ConversionResult]:
+        """Submits settled files; returns the results of those failed without converting (output collisions)."""
+        results = []
+        now = time.monotonic()
+        for path in list(self._pending):
+            if len(self._in_flight) >= self.max_in_flight:
+                break  # Backpressure: the rest wait here until a worker is free.
+            if path not in self._pending or not self._settled(path, now):
+                continue
+            signature, _ = self._pending.pop(path)
+            job = self.make_job(path)
+            settings = self.settings_key(job)
+            try:
+                digest = file_digest(path)
+            except OSError:
+                continue  # Deleted meanwhile; the next scan forgets it.
+            entry = self.state.get(path)
+            if entry and entry['digest'] == digest and entry['settings'] == settings \
+                    and (entry.get('error') or os.path.isfile(job.output_path)):
+                entry['mtime_ns'], entry['size'] = signature
+                self._dirty = True
+                logging.info(f"Content unchanged, not reconverting: {path}")
+                continue
+            key = output_key(job.output_path)
+            if entry and output_key(entry['output']) != key:
+                self._release_output(path)  # Settings changed where its icon goes.
+            owner = self._owners.setdefault(key, path)
+            if owner != path:
+                result = ConversionResult(job.input_path, job.output_path, ok=False,
+                                          error=f"Output path is also the target of {owner}")
+                self._record(path, signature, digest, settings, result, collides_with=owner)
+                results.append(result)
+                continue
+            self._in_flight[executor.submit(run_job, job)] = (path, signature, digest, settings)
+        return results
+
+    def _collect(self) -> List[ConversionResult]:
+        results = []
+        for future in [f for f in self._in_flight if f.done()]:
+            path, signature, digest, settings = self._in_flight.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:  # e.g. a worker process died
+                job = self.make_job(path)
+                result = ConversionResult(job.input_path, job.output_path, ok=False, error=f"{type(e).__name__}: {e}")
+            self._record(path, signature, digest, settings, result)
+            results.append(result)
+            self.observe(path)  # Changed again while it was converting?
+        return results
+
+    def _make_watcher(self):
+        if self.use_inotify is not False and sys.platform.startswith('linux'):
+            try:
+                watcher = InotifyWatcher(self.roots, self._wake_reader, self.recursive)
+                logging.info(f"Watching {', '.join(self.roots)} with inotify.")
+                return watcher, self.rescan_interval
+            except (OSError, AttributeError) as e:
+                if self.use_inotify:
+                    raise
+                logging.warning(f"⚠️ inotify unavailable ({e}); polling instead.")
+        return PollingWatcher(self._wake_reader), None
+
+    def stop(self):
+        """Ends run() after the files being converted have finished. Safe to call from a signal handler."""
+        self._stop.set()
+        try:
+            self._wake_writer.send(b'\0')
+        except OSError:  # Buffer full: a wake-up is already pending.
+            pass
+
+    def run(self, poll_interval: float = 2.0, once: bool = False) -> int:
+        """
+        Converts what changed since the last run, then keeps watching until stop() is called.
+        With once, returns as soon as the initial scan is converted. Returns the number of failures.
+        """
+        watcher, rescan_interval = (PollingWatcher(self._wake_reader), None) if once else self._make_watcher()
+        rescan_interval = rescan_interval or poll_interval
+        failures = 0
+        executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                       initargs=(self.log_level, self.log_file))
+        try:
+            next_scan = 0.0
+            while not self._stop.is_set():
+                now = time.monotonic()
+                if now >= next_scan:
+                    self.scan()
+                    next_scan = now + rescan_interval
+                failures += sum(not r.ok for r in self._collect())
+                failures += len(self._dispatch(executor))
+                self.save_state()
+                if once and not self._pending and not self._in_flight:
+                    break
+
+                timeout = next_scan - time.monotonic()
+                if self._pending:
+                    timeout = min(timeout, self.settle / 4)
+                if self._in_flight:
+                    timeout = min(timeout, 0.1)
+                changed = watcher.wait(max(timeout, 0.01))
+                if changed is None:
+                    next_scan = 0.0
+                else:
+                    for path in changed:
+                        self.observe(path)
+        finally:
+            watcher.close()
+            # Let in-flight files finish so their results are recorded; queued ones wait for the next run.
+            executor.shutdown(wait=True)
+            failures += sum(not r.ok for r in self._collect())
+            self.save_state()
+        return failures
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="Icon_Master_Watch",
+        description="Watch folders and convert new or changed images to .ico files.")
+    parser.add_argument("folders", nargs="+", help="Folders to watch.")
+    add_conversion_arguments(parser)
+    parser.add_argument("-r", "--recursive", action="store_true", help="Also watch sub-folders.")
+    parser.add_argument("--state", metavar="PATH",
+                        help=f"State index file (default: {STATE_FILE_NAME} in the output or first watched folder).")
+    parser.add_argument("--settle", type=float, default=2.0, metavar="SECONDS",
+                        help="Wait until a file has not changed for this long before converting it (default: 2).")
+    parser.add_argument("--poll", action="store_true", help="Poll instead of using inotify, e.g. on network shares.")
+    parser.add_argument("--poll-interval", type=float, default=2.0, metavar="SECONDS",
+                        help="Seconds between rescans when polling (default: 2).")
+    parser.add_argument("--rescan-interval", type=float, default=300.0, metavar="SECONDS",
+                        help="Seconds between safety rescans when using inotify (default: 300).")
+    parser.add_argument("--max-in-flight", type=int, metavar="N",
+                        help="Files handed to the workers at once (default: twice --jobs).")
+    parser.add_argument("--once", action="store_true", help="Convert what changed since the last run, then exit.")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Show converter log messages.")
+    parser.add_argument("--log-file", metavar="PATH", help="Append all converter log messages to PATH.")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    log_level = logging.INFO if args.verbose else logging.WARNING
+    setup_logging(log_level, args.log_file)
+
+    for folder in args.folders:
+        if not os.path.isdir(folder):
+            logging.error(f"Not a folder: {folder}")
+            return 2
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    # Worker processes each encode one file, so frames are encoded serially inside them.
+    encoder = IconEncoder(resample=args.resample, png_min_size=args.png_min_size,
+                          max_workers=1 if args.jobs > 1 else None)
+    overrides = load_overrides(args.overrides)
+    streaming = {"auto": None, "on": True, "off": False}[args.streaming]
+
+    roots = [os.path.abspath(folder) for folder in args.folders]
+
+    def make_job(path: str) -> ConversionJob:
+        # Sub-folders are mirrored under --output-dir, relative to the watched folder they are in.
+        base_dir = next((root for root in roots if path.startswith(os.path.join(root, ''))), None)
+        return build_jobs([path], args.color, args.tolerance, args.output_dir, overrides, args.sizes, encoder,
+                          args.cache_dir, args.cache_size * 1024 * 1024, args.hardlink, streaming,
+                          mode=args.mode, base_dir=base_dir)[0]
+
+    state_path = args.state or os.path.join(args.output_dir or args.folders[0], STATE_FILE_NAME)
+    daemon = WatchDaemon(args.folders, make_job, state_path, workers=args.jobs, recursive=args.recursive,
+                         settle=args.settle, rescan_interval=args.rescan_interval,
+                         max_in_flight=args.max_in_flight, use_inotify=False if args.poll else None,
+                         log_level=log_level, log_file=args.log_file)
+    if hasattr(signal, 'SIGTERM'):
+        signal.signal(signal.SIGTERM, lambda *_: daemon.stop())
+    try:
+        failures = daemon.run(args.poll_interval, once=args.once)
+    except KeyboardInterrupt:
+        return 130
+    return 1 if failures and args.once else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())